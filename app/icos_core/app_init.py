@@ -1,6 +1,9 @@
-from app.icos_core.content_filter import clean_query
+from app.icos_core.content_filter import clean_query, load_pipelines
 
 from app.icos_toolkit.user_session import generate_key
+from app.icos_toolkit.content_processor import BLACKLIST
+from app.icos_toolkit.compression import CompressionMiddleware
+from app.icos_toolkit.filter_lists import load_filter_lists
 
 from app.icos_toolkit.platform_helpers import gen_file_hash, read_config_bool
 from base64 import b64encode
@@ -26,6 +29,11 @@ app = Flask(__name__,
 
 app.wsgi_app = ProxyFix(app.wsgi_app)
 
+# Compress text responses with brotli/gzip, unless disabled (i.e. when a
+# reverse proxy already handles compression)
+if read_config_bool('WHOOGLE_COMPRESSION', True):
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
 # look for WHOOGLE_ENV, else look in parent directory
 dot_env_path = os.getenv(
     "WHOOGLE_DOTENV_PATH",
@@ -73,6 +81,12 @@ app.config['SESSION_FILE_DIR'] = os.path.join(
     app.config['CONFIG_PATH'],
     'session')
 app.config['MAX_SESSION_SIZE'] = 4000  # Sessions won't exceed 4KB
+app.config['FILTER_LISTS_PATH'] = os.getenv(
+    'WHOOGLE_FILTER_LISTS',
+    os.path.join(app.config['CONFIG_PATH'], 'filters'))
+app.config['FILTER_PIPELINES_PATH'] = os.getenv(
+    'WHOOGLE_FILTER_PIPELINES',
+    os.path.join(app.config['CONFIG_PATH'], 'pipelines.json'))
 
 
 # Ensure all necessary directories exist
@@ -87,6 +101,16 @@ if not os.path.exists(app.config['SESSION_FILE_DIR']):
 if not os.path.exists(app.config['BUILD_FOLDER']):
     os.makedirs(app.config['BUILD_FOLDER'])
 
+# Compile ad/tracker filter lists once, so that large lists don't add to the
+# cost of filtering each result page
+app.config['FILTER_LISTS'] = load_filter_lists(
+    app.config['FILTER_LISTS_PATH'],
+    ad_labels=BLACKLIST)
+
+# Filter stages to run for each search type, with any overrides from config
+app.config['FILTER_PIPELINES'] = load_pipelines(
+    app.config['FILTER_PIPELINES_PATH'])
+
 # Session values - using SecureURLShield compatible key generation
 icos_key_path = os.path.join(app.config['CONFIG_PATH'], 'icos.key')
 if os.path.exists(icos_key_path):
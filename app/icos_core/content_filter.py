@@ -8,25 +8,30 @@ transformation with modular architecture and comprehensive security features.
 File: content_filter.py - Core content processing module for ICOS platform
 """
 
-import cssutils
 from bs4 import BeautifulSoup
 from bs4.element import ResultSet, Tag
 import secrets
-from flask import render_template
+from functools import lru_cache
+from flask import current_app, has_app_context, render_template
 import html
+import json
+import os
 import urllib.parse as urlparse
 from urllib.parse import parse_qs
 import re
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Tuple, Union
 import logging
 
 from app.icos_core.element_mapper import GClasses
 from app.icos_core.network_handler import VALID_PARAMS, MAPS_URL
 from app.icos_toolkit.platform_helpers import get_abs_url, read_config_bool
 from app.icos_toolkit.content_processor import (
-    BLANK_B64, GOOG_IMG, GOOG_STATIC, G_M_LOGO_URL, LOGO_URL, SITE_ALTS,
-    has_ad_content, filter_link_args, append_anon_view, get_site_alt,
+    BLACKLIST, BLANK_B64, GOOG_IMG, GOOG_STATIC, G_M_LOGO_URL, LOGO_URL,
+    SITE_ALTS, SITE_ALT_INDEX, SITE_ALT_MATCHER, has_ad_content,
+    filter_link_args, append_anon_view, get_lucky_link, get_site_alt,
 )
+from app.icos_toolkit.blocklist import get_blocklist
+from app.icos_toolkit.filter_lists import FilterLists, SubstringMatcher
 from app.icos_core.route_registry import Endpoint
 from app.icos_core.user_preferences import Config
 from app.icos_toolkit.security_shield import SecureURLShield
@@ -48,6 +53,84 @@ unsupported_g_pages = [
 
 unsupported_g_divs = ['google.com/preferences?hl=', 'ageverification.google.co.kr']
 
+unsupported_g_matcher = SubstringMatcher(unsupported_g_pages)
+unsupported_g_div_matcher = SubstringMatcher(unsupported_g_divs)
+
+# Pre-check for script/iframe tags in unescaped result text
+ESCAPED_TAG_CHECK = re.compile(r'<\s*(?:script|iframe)', re.IGNORECASE)
+
+# url() values and @import strings in stylesheets
+CSS_URL = re.compile(
+    r"""url\(\s*(?P<q>['"]?)(?P<url>.*?)(?P=q)\s*\)"""
+    r"""|@import\s+(?P<iq>['"])(?P<import>.*?)(?P=iq)""",
+    re.IGNORECASE | re.DOTALL)
+
+# Number of cleaned stylesheets kept in memory
+CSS_CACHE_SIZE = 64
+
+# Elements that load remote resources and can be dropped by network rules.
+# Links are navigation rather than resource loads, so they're left to the
+# user's blocklist.
+FILTERED_RESOURCE_TAGS = {'img', 'iframe', 'script', 'link', 'audio'}
+
+# Built-in filter lists, used when no lists have been loaded by the app
+DEFAULT_FILTER_LISTS = FilterLists(ad_labels=BLACKLIST)
+
+# Filter stages run by Filter.clean for results on the All tab, in order
+FILTER_STAGES = (
+    'remove_ads',
+    'apply_filter_lists',
+    # 'remove_images_section',  # Disabled to keep images in All tab results
+    'remove_blocked_results',
+    'collapse_sections',
+    'remove_video_posted_dates',
+    'remove_html_declarations',
+    'update_css',
+    'update_styling',
+    'remove_block_tabs',
+    'remove_google_icons',
+    'sanitize_results',
+    'update_element_srcs',
+    'update_links',
+    'update_site_alts',
+    'update_form',
+    'remove_scripts',
+    'update_footer',
+    'remove_header',
+    'update_maps_links',
+)
+
+
+def _without(*stages: str) -> Tuple[str, ...]:
+    return tuple(_ for _ in FILTER_STAGES if _ not in stages)
+
+
+# Stages that every pipeline runs, so that user blocks always apply
+REQUIRED_STAGES = ('remove_blocked_results',)
+
+# Filter stages by search type ("tbm" value). Stages that can't match
+# anything on a tab's results are left out: the images tab has no ad or
+# text result blocks, and video and news results aren't grouped into
+# collapsible sections (news results also have no posted dates to remove).
+FILTER_PIPELINES = {
+    '': FILTER_STAGES,
+    'isch': _without('remove_ads', 'collapse_sections',
+                     'remove_video_posted_dates', 'sanitize_results'),
+    'vid': _without('collapse_sections'),
+    'nws': _without('collapse_sections', 'remove_video_posted_dates'),
+}
+
+# Stages run before picking the "feeling lucky" link, so that it's the
+# first result left once ads and blocked results are removed
+LUCKY_STAGES = ('remove_ads', 'apply_filter_lists', 'remove_blocked_results')
+
+# Stage replacements for lite mode, where results are re-rendered without
+# page styles or images. Stages mapped to None are skipped.
+LITE_STAGES = {
+    'update_css': None,
+    'update_element_srcs': 'remove_images',
+}
+
 
 def extract_q(q_str: str, href: str) -> str:
     """Extracts the 'q' element from a result link. This is typically
@@ -102,25 +185,164 @@ def clean_query(query: str) -> str:
 def clean_css(css: str, page_url: str) -> str:
     """Removes all remote URLs from a CSS string.
 
+    Google serves the same inline stylesheets on nearly every page, so the
+    rewritten CSS is cached by content and page URL base.
+
     Args:
         css: The CSS string
+        page_url: The URL of the page the CSS was loaded from
 
     Returns:
         str: The filtered CSS, with URLs proxied through Whoogle
     """
-    sheet = cssutils.parseString(css)
-    urls = cssutils.getUrls(sheet)
+    if not css:
+        return css
+
+    # Only relative "./" URLs depend on the full page URL, everything else
+    # is resolved against the page's host
+    base_url = page_url if './' in css else \
+        '//' + urlparse.urlparse(page_url).netloc
+    return _proxy_css_urls(css, base_url)
+
+
+@lru_cache(maxsize=CSS_CACHE_SIZE)
+def _proxy_css_urls(css: str, base_url: str) -> str:
+    def proxy_url(match: re.Match) -> str:
+        url = match['url'] or match['import']
+        if not url or get_abs_url(url, base_url).startswith('data:'):
+            return match[0]
+        abs_url = get_abs_url(url, base_url)
+        return match[0].replace(
+            url, f'{Endpoint.element}?type=image/png&url={abs_url}')
+
+    return CSS_URL.sub(proxy_url, css)
+
+
+def get_filter_lists() -> FilterLists:
+    """Returns the filter lists compiled on app init, or the built-in lists
+    if called outside of the app context.
+
+    Returns:
+        FilterLists: The compiled ad/tracker filter lists
+    """
+    if has_app_context():
+        return current_app.config.get('FILTER_LISTS', DEFAULT_FILTER_LISTS)
+    return DEFAULT_FILTER_LISTS
+
+
+def get_pipeline(search_type: str) -> Tuple[str, ...]:
+    """Returns the filter stages to run for a search type, using the
+    pipelines loaded on app init (which include any config overrides) if
+    called within the app context.
+
+    Args:
+        search_type: The search type ("tbm" value), empty for the All tab
+
+    Returns:
+        tuple: The names of the filter stages, in order
+    """
+    pipelines = current_app.config.get('FILTER_PIPELINES', FILTER_PIPELINES) \
+        if has_app_context() else FILTER_PIPELINES
+    return pipelines.get(search_type or '', pipelines[''])
 
-    for url in urls:
-        abs_url = get_abs_url(url, page_url)
-        if abs_url.startswith('data:'):
+
+def load_pipelines(path: str) -> Dict[str, Tuple[str, ...]]:
+    """Loads the filter pipeline overrides from a json file, mapping search
+    types to lists of stage names (i.e. {"nws": ["update_links", ...]}).
+    Search types without an override keep their default pipeline, and
+    overrides that aren't a list of known stages are ignored. Required
+    stages missing from an override are run first.
+
+    Args:
+        path: The path to the json file
+
+    Returns:
+        dict: The filter pipelines by search type
+    """
+    pipelines = dict(FILTER_PIPELINES)
+    if not os.path.exists(path):
+        return pipelines
+
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f'Unable to load filter pipelines {path}: {e}')
+        return pipelines
+
+    if not isinstance(overrides, dict):
+        logging.warning(f'Ignoring filter pipelines {path}: expected an '
+                        f'object of search types to lists of stages')
+        return pipelines
+
+    for search_type, stages in overrides.items():
+        if not isinstance(stages, list) or \
+                not all(isinstance(_, str) for _ in stages):
+            logging.warning(f'Ignoring "{search_type}" filter pipeline, '
+                            f'expected a list of stage names')
             continue
-        css = css.replace(
-            url,
-            f'{Endpoint.element}?type=image/png&url={abs_url}'
-        )
+        unknown = [_ for _ in stages if _ not in FILTER_STAGES]
+        if unknown:
+            logging.warning(f'Ignoring "{search_type}" filter pipeline, '
+                            f'unknown stages: {", ".join(unknown)}')
+            continue
+
+        missing = [_ for _ in REQUIRED_STAGES if _ not in stages]
+        if missing:
+            logging.warning(f'Adding required stages to "{search_type}" '
+                            f'filter pipeline: {", ".join(missing)}')
+            stages = missing + stages
+        pipelines[search_type] = tuple(stages)
+    return pipelines
+
+
+class Result:
+    """A single search result extracted from a cleaned results page. Results
+    only hold plain strings, so they can be cached, paginated and merged
+    without keeping the page's soup around.
+
+    Attributes:
+        title: The result title
+        url: The (already filtered) link to the result
+        display_url: The breadcrumb style url shown below the title
+        snippet: The result description
+        favicon: The proxied favicon src, if favicons are enabled
+        section: The label of the collapsed section containing the result,
+                 or an empty string for top level results
+    """
+    __slots__ = ('title', 'url', 'display_url', 'snippet', 'favicon',
+                 'section')
 
-    return css
+    def __init__(
+            self,
+            title: str,
+            url: str,
+            display_url='',
+            snippet='',
+            favicon='',
+            section='') -> None:
+        self.title = title
+        self.url = url
+        self.display_url = display_url
+        self.snippet = snippet
+        self.favicon = favicon
+        self.section = section
+
+    def __repr__(self) -> str:
+        return f'Result({self.title!r}, {self.url!r})'
+
+    def to_dict(self, fields: Optional[List[str]] = None) -> Dict[str, str]:
+        """Returns the result as a dict
+
+        Args:
+            fields: The attributes to include, defaults to all attributes
+
+        Returns:
+            dict: The result attributes by name
+        """
+        return {field: getattr(self, field)
+                for field in fields or self.__slots__
+                if field in self.__slots__}
 
 
 class IcosContentFilterEngine:
@@ -135,7 +357,10 @@ class IcosContentFilterEngine:
             root_url='',
             page_url='',
             query='',
-            mobile=False) -> None:
+            mobile=False,
+            filter_lists: Optional[FilterLists] = None,
+            search_type='',
+            lite=False) -> None:
         self.soup = None
         self.config = config
         self.mobile = mobile
@@ -145,6 +370,25 @@ class IcosContentFilterEngine:
         self.main_divs = ResultSet('')
         self._elements = 0
         self._av = set()
+        self._favicon_srcs = {}
+        self._favicon_targets = {}
+        self._parsed_hrefs = {}
+        self._search_hrefs = {}
+        self._footer_links = None
+        self._result_parents = None
+        self.lite = lite
+        self.show_favicons = not lite and read_config_bool(
+            'WHOOGLE_SHOW_FAVICONS', True)
+        self.filter_lists = filter_lists if filter_lists is not None \
+            else get_filter_lists()
+        self.search_type = search_type
+        self.pipeline = get_pipeline(search_type)
+        if lite:
+            self.pipeline = tuple(LITE_STAGES.get(_, _) for _ in self.pipeline
+                                  if LITE_STAGES.get(_, _))
+        self.blocklist = get_blocklist(config.block,
+                                       config.block_title,
+                                       config.block_url)
 
         self.root_url = root_url[:-1] if root_url.endswith('/') else root_url
 
@@ -175,27 +419,42 @@ class IcosContentFilterEngine:
     def clean(self, soup) -> BeautifulSoup:
         self.soup = soup
         self.main_divs = self.soup.find('div', {'id': 'main'})
+        self._footer_links = None
+        self._result_parents = None
         
 
         
-        self.remove_ads()
-        # self.remove_images_section()  # Disabled to keep images in All tab results
-        self.remove_block_titles()
-        self.remove_block_url()
-        self.collapse_sections()
-        self.remove_video_posted_dates()
-        self.remove_html_declarations()
-        self.update_css()
-        self.update_styling()
-        self.remove_block_tabs()
-        self.remove_google_icons()
+        for stage in self.pipeline:
+            getattr(self, stage)()
+
+        return self.soup
 
+    def find_lucky_link(self, soup) -> str:
+        """Finds the link to redirect a "feeling lucky" search to. Only the
+        stages that remove results (see LUCKY_STAGES) are run, rather than
+        the full pipeline.
+
+        Args:
+            soup: The unfiltered results page
+
+        Returns:
+            str: The first result link, or an empty string
+        """
+        self.soup = soup
+        self.main_divs = self.soup.find('div', {'id': 'main'})
+        for stage in LUCKY_STAGES:
+            getattr(self, stage)()
+
+        return get_lucky_link(self.main_divs or self.soup)
+
+    def sanitize_results(self) -> None:
         # self.main_divs is only populated for the main page of search results
         # (i.e. not images/news/etc).
         if self.main_divs:
             for div in self.main_divs:
                 self.sanitize_div(div)
 
+    def update_element_srcs(self) -> None:
         for img in [_ for _ in self.soup.find_all('img') if 'src' in _.attrs]:
             self.update_element_src(img, 'image/png')
 
@@ -203,23 +462,34 @@ class IcosContentFilterEngine:
             self.update_element_src(audio, 'audio/mpeg')
             audio['controls'] = ''
 
+    def remove_images(self) -> None:
+        # Lite mode only, in place of passing images through the element
+        # endpoint
+        for element in self.soup.find_all(['img', 'audio', 'svg']):
+            element.decompose()
+
+    def update_links(self) -> None:
         for link in self.soup.find_all('a', href=True):
             self.update_link(link)
             self.add_favicon(link)
 
+    def update_site_alts(self) -> None:
         if self.config.alts:
             self.site_alt_swap()
 
+    def update_form(self) -> None:
         input_form = self.soup.find('form')
         if input_form is not None:
             input_form['method'] = 'GET' if self.config.get_only else 'POST'
             # Use a relative URI for submissions
             input_form['action'] = 'search'
 
+    def remove_scripts(self) -> None:
         # Ensure no extra scripts passed through
         for script in self.soup('script'):
             script.decompose()
 
+    def update_footer(self) -> None:
         # Update default footer and header
         footer = self.soup.find('footer')
         if footer:
@@ -229,10 +499,12 @@ class IcosContentFilterEngine:
             for link in footer.find_all('a', href=True):
                 link['href'] = f'{link["href"]}&preferences={self.config.preferences}'
 
+    def remove_header(self) -> None:
         header = self.soup.find('header')
         if header:
             header.decompose()
-        
+
+    def update_maps_links(self) -> None:
         # Remove Maps tab icons only, not the entire tab
         maps_links = self.soup.find_all('a', href=lambda x: x and 'maps.google.com' in x)
         for link in maps_links:
@@ -240,9 +512,6 @@ class IcosContentFilterEngine:
             for child in link.find_all():
                 if child.name in ['img', 'svg', 'i', 'span'] and not child.get_text().strip():
                     child.decompose()
-            
-        self.remove_site_blocks(self.soup)
-        return self.soup
 
     def remove_google_icons(self) -> None:
         """Removes only footer elements with Google logos, Privacy/Terms links, and location info while preserving search results
@@ -308,8 +577,15 @@ class IcosContentFilterEngine:
             if not d_text or not d.string:
                 continue
 
-            d.string = html.unescape(d_text)
-            div_soup = BeautifulSoup(d.string, 'html.parser')
+            d_text = html.unescape(d_text)
+
+            # Only parse the text if it actually contains a script or iframe
+            if not ESCAPED_TAG_CHECK.search(d_text):
+                if d_text != d.string:
+                    d.string = d_text
+                continue
+
+            div_soup = BeautifulSoup(d_text, 'html.parser')
 
             # Remove all valid script or iframe tags in the div
             for script in div_soup.find_all('script'):
@@ -371,89 +647,136 @@ class IcosContentFilterEngine:
             None (The soup object is modified directly)
         """
         # Skip empty, parentless, or internal links
-        show_favicons = read_config_bool('WHOOGLE_SHOW_FAVICONS', True)
         is_valid_link = link and link.parent and link['href'].startswith('http')
-        if not show_favicons or not is_valid_link:
+        if not self.show_favicons or not is_valid_link:
             return
 
-        # Skip if this link already has a favicon or is not a result link
-        if link.find_previous_sibling('img', class_='site-favicon'):
+        # Skip if this link's container already has a favicon, or if one of
+        # its ancestors was found to have one
+        parent = link.parent
+        _, favicon_target = self._favicon_targets.get(id(parent), (None, False))
+        if favicon_target is None or (
+                favicon_target and
+                'has-favicon' in (favicon_target.attrs.get('class') or [])):
             return
-            
+
         # Check if this is a title link (contains text and is likely a result title)
         link_text = link.get_text(strip=True)
         if not link_text or len(link_text) < 3:
             return
 
-        # Find the appropriate parent container for the favicon
-        parent = link.parent
-        favicon_target = None
-        
-        # Look for a suitable container (either the direct parent or a result div)
+        # Find the appropriate parent container for the favicon once per
+        # parent, since result links tend to share the same container
+        if favicon_target is False:
+            favicon_target = self._find_favicon_target(parent)
+            self._favicon_targets[id(parent)] = (parent, favicon_target)
+            if favicon_target is None:
+                return
+
+        # Shield each favicon url only once per site
+        parsed = urlparse.urlparse(link['href'])
+        src = self._favicon_srcs.get(parsed.netloc)
+        if src is None:
+            favicon_url = self.encrypt_path(
+                f'{parsed.scheme}://{parsed.netloc}/favicon.ico',
+                is_element=True)
+            src = f'{self.root_url}/{Endpoint.element}?url={favicon_url}' + \
+                '&type=image/x-icon'
+            self._favicon_srcs[parsed.netloc] = src
+
+        # Insert favicon before the link
+        link.insert_before(self.soup.new_tag(
+            'img', attrs={'class': 'site-favicon', 'src': src, 'alt': ''}))
+
+        # Mark the target container as having a favicon
+        target_cls = favicon_target.attrs.get('class') or []
+        target_cls.append('has-favicon')
+        favicon_target['class'] = target_cls
+
+    @staticmethod
+    def _find_favicon_target(parent: Tag) -> Optional[Tag]:
+        """Finds the result container for a link's favicon
+
+        Args:
+            parent: The parent of the result link
+
+        Returns:
+            Tag: The container to add the favicon to, or None if a container
+                 already has one
+        """
         current = parent
         depth = 0
         while current and depth < 10:
             p_cls = current.attrs.get('class') or []
             if 'has-favicon' in p_cls:
-                return  # Already has favicon
-            
+                return None  # Already has favicon
+
             # Check for result containers (including mobile format)
-            if (GClasses.result_class_a in p_cls or 
-                'ezO2md' in p_cls or  # Mobile result div
-                any('result' in cls.lower() for cls in p_cls)):
-                favicon_target = current
-                break
-            
+            if (GClasses.result_class_a in p_cls or
+                    'ezO2md' in p_cls or  # Mobile result div
+                    any('result' in cls.lower() for cls in p_cls)):
+                return current
+
             current = current.parent
             depth += 1
 
         # If we didn't find a specific result container, use the direct parent
-        if not favicon_target:
-            favicon_target = parent
+        return parent
 
-        # Construct the html for inserting the icon
-        parsed = urlparse.urlparse(link['href'])
-        favicon_url = self.encrypt_path(
-            f'{parsed.scheme}://{parsed.netloc}/favicon.ico',
-            is_element=True)
-        src = f'{self.root_url}/{Endpoint.element}?url={favicon_url}' + \
-            '&type=image/x-icon'
-        html = f'<img class="site-favicon" src="{src}" alt="">'
-
-        favicon_soup = BeautifulSoup(html, 'html.parser')
-        
-        # Insert favicon before the link
-        link.insert_before(favicon_soup)
-
-        # Mark the target container as having a favicon
-        target_cls = favicon_target.attrs.get('class') or []
-        target_cls.append('has-favicon')
-        favicon_target['class'] = target_cls
+    def remove_ads(self) -> None:
+        """Removes ads found in the list of search result divs
 
-    def remove_site_blocks(self, soup) -> None:
-        if not self.config.block or not soup.body:
+        Returns:
+            None (The soup object is modified directly)
+        """
+        if not self.main_divs:
             return
-        search_string = ' '.join(['-site:' +
-                                 _ for _ in self.config.block.split(',')])
-        selected = soup.body.findAll(text=re.compile(search_string))
 
-        for result in selected:
-            result.string.replace_with(result.string.replace(
-                                       search_string, ''))
+        ad_labels = self.filter_lists.ad_labels
+        for span in self.main_divs.find_all('span'):
+            if span.decomposed or not has_ad_content(span.text, ad_labels):
+                continue
 
-    def remove_ads(self) -> None:
-        """Removes ads found in the list of search result divs
+            # Remove the outermost result div containing the ad label
+            ad_div = None
+            for parent in span.parents:
+                if parent is self.main_divs:
+                    break
+                if parent.name == 'div':
+                    ad_div = parent
+            if ad_div:
+                ad_div.decompose()
+
+    def apply_filter_lists(self, soup=None, site='') -> None:
+        """Removes elements matching the loaded ad/tracker filter lists, using
+        the element hiding rules and the network rules for remote resources.
+
+        Args:
+            soup: The soup to filter, defaults to the current results page
+            site: The hostname of the page, for site specific hiding rules
 
         Returns:
             None (The soup object is modified directly)
         """
-        if not self.main_divs:
+        soup = soup or self.soup
+        filter_lists = self.filter_lists
+        if not filter_lists or not soup:
             return
 
-        for div in [_ for _ in self.main_divs.find_all('div', recursive=True)]:
-            div_ads = [_ for _ in div.find_all('span', recursive=True)
-                       if has_ad_content(_.text)]
-            _ = div.decompose() if len(div_ads) else None
+        for tag in soup.find_all(True):
+            if tag.decomposed:
+                continue
+
+            if filter_lists.hides(tag.name, tag.attrs, site):
+                tag.decompose()
+                continue
+
+            if tag.name not in FILTERED_RESOURCE_TAGS:
+                continue
+
+            url = tag.attrs.get('src') or tag.attrs.get('href') or ''
+            if filter_lists.blocks_url(url):
+                tag.decompose()
 
     def remove_images_section(self) -> None:
         """DISABLED: Previously removed the Images section from search results in the All tab
@@ -485,23 +808,47 @@ class IcosContentFilterEngine:
         #         len(div.find_all('img', recursive=True)) > 2):
         #         div.decompose()
 
-    def remove_block_titles(self) -> None:
-        if not self.main_divs or not self.config.block_title:
-            return
-        block_title = re.compile(self.config.block_title)
-        for div in [_ for _ in self.main_divs.find_all('div', recursive=True)]:
-            block_divs = [_ for _ in div.find_all('h3', recursive=True)
-                          if block_title.search(_.text) is not None]
-            _ = div.decompose() if len(block_divs) else None
-
-    def remove_block_url(self) -> None:
-        if not self.main_divs or not self.config.block_url:
+    def _result_container(self, tag: Tag) -> Optional[Tag]:
+        if self.main_divs:
+            # The outermost div within the results
+            container = None
+            for parent in tag.parents:
+                if parent is self.main_divs:
+                    return container
+                if parent.name == 'div':
+                    container = parent
+            return None
+
+        # Image results are table cells, or "isv-r" divs in combined pages
+        return tag.find_parent(
+            lambda _: _.name == 'td' or 'isv-r' in _.get('class', []))
+
+    def remove_blocked_results(self) -> None:
+        """Removes results from sites, or with titles or urls, blocked in the
+        user's config, checking each result link and title in one pass
+
+        Returns:
+            None (The soup object is modified directly)
+        """
+        blocklist = self.blocklist
+        if not blocklist:
             return
-        block_url = re.compile(self.config.block_url)
-        for div in [_ for _ in self.main_divs.find_all('div', recursive=True)]:
-            block_divs = [_ for _ in div.find_all('a', recursive=True)
-                          if block_url.search(_.attrs['href']) is not None]
-            _ = div.decompose() if len(block_divs) else None
+
+        scope = self.main_divs or self.soup
+        for tag in scope.find_all(['a', 'h3']):
+            if tag.decomposed:
+                continue
+
+            if tag.name == 'h3':
+                blocked = blocklist.blocks_title(tag.text)
+            elif href := tag.get('href'):
+                url = self._link_q(href) if '/url?' in href else href
+                blocked = blocklist.blocks_url(url, href)
+            else:
+                continue
+
+            if blocked and (container := self._result_container(tag)):
+                container.decompose()
 
     def remove_block_tabs(self) -> None:
         if self.main_divs:
@@ -527,7 +874,7 @@ class IcosContentFilterEngine:
         Returns:
             None (The soup object is modified directly)
         """
-        minimal_mode = read_config_bool('WHOOGLE_MINIMAL')
+        minimal_mode = self.lite or read_config_bool('WHOOGLE_MINIMAL')
 
         def pull_child_divs(result_div: BeautifulSoup):
             try:
@@ -541,35 +888,44 @@ class IcosContentFilterEngine:
         if not self.main_divs:
             return
 
-        # Loop through results and check for the number of child divs in each
-        for result in self.main_divs.find_all():
-            result_children = pull_child_divs(result)
-            
+        # Loop through the top level result blocks and check for the number
+        # of child divs in each
+        for result in self.main_divs.find_all('div', recursive=False):
+            # Skip past wrappers around the result block's child divs
+            block = result
+            result_children = pull_child_divs(block)
+            while len(result_children) == 1:
+                block = block.find('div', recursive=False)
+                result_children = pull_child_divs(block)
+
+            if not result_children:
+                continue
+
+            # Section labels and text are collected once per block, rather
+            # than serializing the child divs for every check
+            labels = {span.get_text(strip=True) for s in result_children
+                      for span in s.find_all('span')}
+            result_text = ' '.join(s.get_text() for s in result_children)
+
             # Always remove Images section regardless of minimal mode
-            if any(f">Images</span" in str(s) or "Images" in str(s) and "View all" in str(s) for s in result_children):
+            if 'Images' in labels or (
+                    'Images' in result_text and 'View all' in result_text):
                 result.decompose()
                 continue
-            
+
             # Preserve "People also ask" sections - don't collapse them
-            result_text = ' '.join(str(s) for s in result_children).lower()
-            if any(phrase in result_text for phrase in ['people also ask', 'related questions', 'people also search']):
+            lower_text = result_text.lower()
+            if any(phrase in lower_text for phrase in ['people also ask', 'related questions', 'people also search']):
                 continue
 
-            
-            if minimal_mode:
-                if any(f">{x}</span" in str(s) for s in result_children
-                   for x in minimal_mode_sections):
-                    result.decompose()
-                    continue
-                for s in result_children:
-                    if ('Twitter ›' in str(s)):
-                        result.decompose()
-                        continue
-                if len(result_children) < self.RESULT_CHILD_LIMIT:
-                    continue
-            else:
-                if len(result_children) < self.RESULT_CHILD_LIMIT:
-                    continue
+            if minimal_mode and (
+                    any(x in labels for x in minimal_mode_sections) or
+                    'Twitter ›' in result_text):
+                result.decompose()
+                continue
+
+            if len(result_children) < self.RESULT_CHILD_LIMIT:
+                continue
 
             # Find and decompose the first element with an inner HTML text val.
             # This typically extracts the title of the section
@@ -582,8 +938,8 @@ class IcosContentFilterEngine:
                     content = list(elem.strings)
                     label = content[0]
                     if len(content) > 1:
-                        subtitle = '<span> (' + \
-                            ''.join(content[1:]) + ')</span>'
+                        subtitle = self.soup.new_tag('span')
+                        subtitle.string = ' (' + ''.join(content[1:]) + ')'
                     elem.decompose()
                     break
 
@@ -595,13 +951,12 @@ class IcosContentFilterEngine:
                 parent = result_children[idx].parent
                 idx += 1
 
-            details = BeautifulSoup(features='html.parser').new_tag('details')
-            summary = BeautifulSoup(features='html.parser').new_tag('summary')
+            details = self.soup.new_tag('details')
+            summary = self.soup.new_tag('summary')
             summary.string = label
 
             if subtitle:
-                soup = BeautifulSoup(subtitle, 'html.parser')
-                summary.append(soup)
+                summary.append(subtitle)
 
             details.append(summary)
 
@@ -667,16 +1022,18 @@ class IcosContentFilterEngine:
             # print(link)
 
     def update_styling(self) -> None:
-        # Update CSS classes for result divs
-        soup = GClasses.replace_css_classes(self.soup)
+        for elem in self.soup.find_all(True):
+            if elem.decomposed:
+                continue
 
-        # Remove unnecessary button(s)
-        for button in self.soup.find_all('button'):
-            button.decompose()
+            # Remove unnecessary button(s) and svg logos
+            if elem.name in ('button', 'svg'):
+                elem.decompose()
+                continue
 
-        # Remove svg logos
-        for svg in self.soup.find_all('svg'):
-            svg.decompose()
+            # Update CSS classes for result divs
+            if elem.name == 'div':
+                GClasses.remap_classes(elem)
 
         # Update logo
         logo = self.soup.find('a', {'class': 'l'})
@@ -713,6 +1070,61 @@ class IcosContentFilterEngine:
                          css)
             style.string = css
 
+    def _parse_href(
+            self,
+            href: str) -> Tuple[urlparse.ParseResult, Dict[str, List[str]]]:
+        """Parses a link and its query string. Results are memoized for the
+        filter, since the same hrefs are repeated heavily within a page.
+
+        Args:
+            href: The link to parse
+
+        Returns:
+            tuple: The parsed link and its query args (blank values included)
+        """
+        parsed = self._parsed_hrefs.get(href)
+        if parsed is None:
+            parsed_link = urlparse.urlparse(href)
+            parsed = (parsed_link,
+                      parse_qs(parsed_link.query, keep_blank_values=True))
+            self._parsed_hrefs[href] = parsed
+        return parsed
+
+    def _link_q(self, href: str) -> str:
+        """Memoized equivalent of extract_q for a link
+
+        Args:
+            href: The full url to extract the 'q' element from
+
+        Returns:
+            str: The 'q' element of the link, or an empty string
+        """
+        if '&q=' not in href and '?q=' not in href:
+            return ''
+        return self._parse_href(href)[1]['q'][0]
+
+    def _index_link_ancestors(self) -> None:
+        """Flags links nested in the page footer and maps links to their
+        closest result div, so that update_link doesn't need to walk up the
+        tree for every link.
+
+        Returns:
+            None
+        """
+        self._footer_links = set()
+        self._result_parents = {}
+
+        footers = self.soup.find_all('footer') + self.soup.find_all(
+            class_=GClasses.footer)
+        for footer in footers:
+            self._footer_links.update(id(_) for _ in footer.find_all('a'))
+
+        # Results are visited in document order, so nested result divs
+        # overwrite their ancestors
+        for result in self.soup.find_all(class_=GClasses.result_class_a):
+            for link in result.find_all('a'):
+                self._result_parents[id(link)] = result
+
     def update_link(self, link: Tag) -> None:
         """Update internal link paths with encrypted path, otherwise remove
         unnecessary redirects and/or marketing params from the url
@@ -724,49 +1136,46 @@ class IcosContentFilterEngine:
             None (the tag is updated directly)
 
         """
-        parsed_link = urlparse.urlparse(link['href'])
+        if link.decomposed:
+            # Already removed along with an earlier link's result div
+            return
+
         if '/url?q=' in link['href']:
-            link_netloc = extract_q(parsed_link.query, link['href'])
+            link_netloc = self._link_q(link['href'])
         else:
-            link_netloc = parsed_link.netloc
+            link_netloc = self._parse_href(link['href'])[0].netloc
 
         # Remove any elements that direct to unsupported Google pages
-        if any(url in link_netloc for url in unsupported_g_pages):
+        if link_netloc in unsupported_g_matcher:
             # FIXME: The "Shopping" tab requires further filtering (see #136)
             # Temporarily removing all links to that tab for now.
 
             # Replaces the /url google unsupported link to the direct url
             link['href'] = link_netloc
-            parent = link.parent
 
-            if any(divlink in link_netloc for divlink in unsupported_g_divs):
+            if self._footer_links is None:
+                self._index_link_ancestors()
+
+            if link_netloc in unsupported_g_div_matcher:
                 # Handle case where a search is performed in a different
                 # language than what is configured. This usually returns a
                 # div with the same classes as normal search results, but with
                 # a link to configure language preferences through Google.
                 # Since we want all language config done through Whoogle, we
                 # can safely decompose this element.
-                while parent:
-                    p_cls = parent.attrs.get('class') or []
-                    if f'{GClasses.result_class_a}' in p_cls:
-                        parent.decompose()
-                        break
-                    parent = parent.parent
-            else:
+                parent = self._result_parents.get(id(link))
+                if parent and not parent.decomposed:
+                    parent.decompose()
+            elif id(link) in self._footer_links:
                 # Remove cases where google links appear in the footer
-                while parent:
-                    p_cls = parent.attrs.get('class') or []
-                    if parent.name == 'footer' or f'{GClasses.footer}' in p_cls:
-                        link.decompose()
-                    parent = parent.parent
+                link.decompose()
 
             if link.decomposed:
                 return
 
         # Replace href with only the intended destination (no "utm" type tags)
         href = link['href'].replace('https://www.google.com', '')
-        result_link = urlparse.urlparse(href)
-        q = extract_q(result_link.query, href)
+        q = self._link_q(href)
 
         if q.startswith('/') and q not in self.query and 'spell=1' not in href:
             # Internal google links (i.e. mail, maps, etc) should still
@@ -781,14 +1190,20 @@ class IcosContentFilterEngine:
             # which is accomplished by wrapping the query in double quotes
             if 'li:1' in href:
                 q = '"' + q + '"'
-            new_search = 'search?q=' + self.encrypt_path(q)
-
-            query_params = parse_qs(urlparse.urlparse(href).query)
-            for param in VALID_PARAMS:
-                if param not in query_params:
-                    continue
-                param_val = query_params[param][0]
-                new_search += '&' + param + '=' + param_val
+            # Google repeats the same search links throughout the page
+            # (related searches, tabs, pagination), so each is only
+            # encrypted once
+            new_search = self._search_hrefs.get(href)
+            if new_search is None:
+                new_search = 'search?q=' + self.encrypt_path(q)
+
+                query_params = self._parse_href(href)[1]
+                for param in VALID_PARAMS:
+                    param_vals = [_ for _ in query_params.get(param, []) if _]
+                    if not param_vals:
+                        continue
+                    new_search += '&' + param + '=' + param_vals[0]
+                self._search_hrefs[href] = new_search
             link['href'] = new_search
         elif 'url?q=' in href:
             # Strip unneeded arguments
@@ -796,7 +1211,7 @@ class IcosContentFilterEngine:
 
             # Add alternate viewing options for results,
             # if the result doesn't already have an AV link
-            netloc = urlparse.urlparse(link['href']).netloc
+            netloc = self._parse_href(link['href'])[0].netloc
             if self.config.anon_view and netloc not in self._av:
                 self._av.add(netloc)
                 append_anon_view(link, self.config)
@@ -829,50 +1244,158 @@ class IcosContentFilterEngine:
         """Replaces link locations and page elements if "alts" config
         is enabled
         """
-        for site, alt in SITE_ALTS.items():
-            if site != "medium.com" and alt != "":
-                # Ignore medium.com replacements since these are handled
-                # specifically in the link description replacement, and medium
-                # results are never given their own "card" result where this
-                # replacement would make sense.
-                # Also ignore if the alt is empty, since this is used to indicate
-                # that the alt is not enabled.
-                for div in self.soup.find_all('div', text=re.compile(site)):
-                    # Use the number of words in the div string to determine if the
-                    # string is a result description (shouldn't replace domains used
-                    # in desc text).
-                    if len(div.string.split(' ')) == 1:
-                        div.string = div.string.replace(site, alt)
-
-            for link in self.soup.find_all('a', href=True):
-                # Search and replace all link descriptions
-                # with alternative location
-                link['href'] = get_site_alt(link['href'])
-                link_desc = link.find_all(
-                    text=re.compile('|'.join(SITE_ALTS.keys())))
-                if len(link_desc) == 0:
-                    continue
-
-                # Replace link description
-                link_desc = link_desc[0]
-                if site not in link_desc or not alt:
-                    continue
-
-                new_desc = BeautifulSoup(features='html.parser').new_tag('div')
-                link_str = str(link_desc)
-
-                # Medium links should be handled differently, since 'medium.com'
-                # is a common substring of domain names, but shouldn't be
-                # replaced (i.e. 'philomedium.com' should stay as it is).
+        # Medium.com replacements are ignored in result cards since these are
+        # handled specifically in the link description replacement, and medium
+        # results are never given their own "card" result where this
+        # replacement would make sense.
+        # Sites with an empty alt aren't in SITE_ALT_INDEX, since this is used
+        # to indicate that the alt is not enabled.
+        def matched_sites(text) -> list:
+            # Enabled sites found by the matcher, longest first. The matcher
+            # ignores case, so each hit is checked against the text as is.
+            return sorted((site for site in SITE_ALT_MATCHER.findall(text)
+                           if site in SITE_ALT_INDEX and site in text),
+                          key=len, reverse=True)
+
+        def has_site(text) -> bool:
+            return bool(matched_sites(text))
+
+        for div in self.soup.find_all('div', string=has_site):
+            # Use the number of words in the div string to determine if the
+            # string is a result description (shouldn't replace domains used
+            # in desc text).
+            if len(div.string.split(' ')) != 1:
+                continue
+            div_str = str(div.string)
+            for site in matched_sites(div_str):
+                if site != 'medium.com':
+                    div_str = div_str.replace(site, SITE_ALT_INDEX[site])
+            div.string = div_str
+
+        for link in self.soup.find_all('a', href=True):
+            # Search and replace all link descriptions
+            # with alternative location
+            link['href'] = get_site_alt(link['href'])
+            link_desc = link.find(string=has_site)
+            if not link_desc:
+                continue
+
+            # Replace link description
+            link_str = str(link_desc)
+            for site in matched_sites(link_str):
+                # Medium links should be handled differently, since
+                # 'medium.com' is a common substring of domain names, but
+                # shouldn't be replaced (i.e. 'philomedium.com' should stay
+                # as it is).
                 if 'medium.com' in link_str:
-                    if link_str.startswith('medium.com') or '.medium.com' in link_str:
+                    if link_str.startswith('medium.com') or \
+                            '.medium.com' in link_str:
                         link_str = SITE_ALTS['medium.com'] + link_str[
                             link_str.find('medium.com') + len('medium.com'):]
-                    new_desc.string = link_str
                 else:
-                    new_desc.string = link_str.replace(site, alt)
+                    link_str = link_str.replace(site, SITE_ALT_INDEX[site])
+
+            new_desc = self.soup.new_tag('div')
+            new_desc.string = link_str
+            link_desc.replace_with(new_desc)
+
+    def extract_results(self, soup=None) -> List[Result]:
+        """Extracts the results from a cleaned results page into Result
+        records, in page order. Only results with a title link are extracted
+        (answer cards, related searches, etc are skipped).
+
+        Args:
+            soup: The cleaned page, defaults to the filter's current soup
+
+        Returns:
+            list: The extracted results
+        """
+        main_divs = soup.find('div', {'id': 'main'}) if soup else \
+            self.main_divs
+        if not main_divs:
+            return []
+
+        results = []
+        for result_div in main_divs.find_all(
+                'div', class_=GClasses.result_class_a):
+            title = result_div.find('h3')
+            if not title or result_div.find(
+                    'div', class_=GClasses.result_class_a):
+                # Only the innermost result divs are extracted
+                continue
+
+            # The title link is the closest link wrapping the title within
+            # the result, and the link block is the result's child holding it
+            link = None
+            link_block = title
+            while link_block.parent is not result_div:
+                link_block = link_block.parent
+                if not link and link_block.name == 'a' and \
+                        link_block.has_attr('href'):
+                    link = link_block
+            if not link:
+                continue
+
+            # The display url is the text of the link that follows the title
+            display_url = ' '.join(
+                _.get_text(' ', strip=True)
+                for _ in title.find_next_siblings())
+
+            # The snippet is the text of the result outside of the link block
+            snippet = ' '.join(
+                _.get_text(' ', strip=True)
+                for _ in link_block.find_next_siblings())
+
+            favicon = result_div.find('img', class_='site-favicon')
+            section = result_div.find_parent('details')
+            section = section.summary if section else None
+
+            results.append(Result(
+                title=title.get_text(' ', strip=True),
+                url=link['href'],
+                display_url=display_url,
+                snippet=snippet,
+                favicon=favicon['src'] if favicon else '',
+                section=section.get_text(' ', strip=True) if section else ''))
+
+        return results
+
+    def render_images(self, images: List[dict], next_page='') -> str:
+        """Renders extracted image results (see image_results.extract_images)
+        as the images tab, skipping results from blocked sites. Thumbnails
+        are passed through the element endpoint.
+
+        Args:
+            images: The image results
+            next_page: The link to the next page of results, if any
+
+        Returns:
+            str: The rendered image results
+        """
+        results = []
+        for image in images:
+            if self.blocklist and self.blocklist.blocks_url(image['web_page']):
+                continue
 
-                link_desc.replace_with(new_desc)
+            img_tbn = image['img_tbn']
+            if not img_tbn.startswith('data:'):
+                if img_tbn.startswith('//'):
+                    img_tbn = 'https:' + img_tbn
+                img_tbn = f'{self.root_url}/{Endpoint.element}?url=' + (
+                    self.encrypt_path(img_tbn, is_element=True) +
+                    '&type=' + urlparse.quote('image/png'))
+
+            results.append(dict(
+                image,
+                img_url=image['img_url'] or img_tbn,
+                web_page=filter_link_args(image['web_page']),
+                img_tbn=img_tbn))
+
+        return render_template('imageresults.html',
+                               length=len(results),
+                               results=results,
+                               next_page=next_page,
+                               view_label='View Image')
 
     def view_image(self, soup) -> BeautifulSoup:
         """Replaces the soup with a new one that handles mobile results and
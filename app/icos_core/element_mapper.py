@@ -42,6 +42,15 @@ class SearchElementMapper:
             self.primary_result_container: ['Gx5Zad'],
             self.secondary_result_container: ['fP1Qef']
         }
+
+        # Reverse lookup of source class -> target class, so that an
+        # element's class list can be remapped in a single step
+        self._class_map = {
+            source_class: target_class
+            for target_class, source_classes
+            in self._transformation_registry.items()
+            for source_class in source_classes
+        }
     
     @property
     def main_tbm_tab(self) -> str:
@@ -120,13 +129,8 @@ class SearchElementMapper:
         Returns:
             List of elements that need transformation
         """
-        # Build list of all classes that need to be found
-        search_classes = []
-        for class_list in self._transformation_registry.values():
-            search_classes.extend(class_list)
-            
-        # Find all div elements with these classes
-        return content.find_all('div', {'class': search_classes})
+        # Find all div elements with the source classes
+        return content.find_all('div', {'class': list(self._class_map)})
     
     def _apply_element_transformation(self, element: Any) -> None:
         """
@@ -135,19 +139,32 @@ class SearchElementMapper:
         Args:
             element: The BeautifulSoup element to transform
         """
-        if not element.get('class'):
-            return
-            
-        current_classes = ' '.join(element['class'])
-        transformed_classes = current_classes
-        
-        # Apply each transformation rule
-        for target_class, source_classes in self._transformation_registry.items():
-            for source_class in source_classes:
-                transformed_classes = transformed_classes.replace(source_class, target_class)
+        self.remap_classes(element)
+
+    def remap_classes(self, element: Any) -> bool:
+        """
+        Replace any source classes in an element's class list with their
+        target classes. Only whole class names are replaced.
         
-        # Update the element with transformed classes
-        element['class'] = transformed_classes.split(' ')
+        Args:
+            element: The BeautifulSoup element to transform
+            
+        Returns:
+            bool: True if the element's classes were changed
+        """
+        classes = element.get('class')
+        if not classes:
+            return False
+
+        if isinstance(classes, str):
+            classes = classes.split()
+
+        class_map = self._class_map
+        if not any(cls in class_map for cls in classes):
+            return False
+
+        element['class'] = [class_map.get(cls, cls) for cls in classes]
+        return True
 
 
 # Maintain compatibility with existing ICOS codebase
@@ -156,8 +173,7 @@ GClasses = SearchElementMapper()
 # Legacy method alias for backward compatibility  
 def replace_css_classes(soup: BeautifulSoup) -> BeautifulSoup:
     """Legacy compatibility function for CSS class replacement."""
-    mapper = SearchElementMapper()
-    return mapper.transform_page_elements(soup)
+    return GClasses.transform_page_elements(soup)
 
 # Add the method to the instance for compatibility
 GClasses.replace_css_classes = lambda soup: GClasses.transform_page_elements(soup)
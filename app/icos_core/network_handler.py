@@ -1,4 +1,6 @@
 from app.icos_core.user_preferences import Config
+from app.icos_toolkit.body_decoder import decode_body
+from app.icos_toolkit.query_intent import QueryIntent, classify_query
 
 from datetime import datetime
 from defusedxml import ElementTree as ET
@@ -45,15 +47,16 @@ def gen_user_agent(config, is_mobile) -> str:
     return DESKTOP_UA.format("Mozilla", linux, firefox)
 
 
-def gen_query(query, args, config) -> str:
+def gen_query(query, args, config, intent: QueryIntent = None) -> str:
     param_dict = {key: '' for key in VALID_PARAMS}
+    if intent is None:
+        intent = classify_query(query, config)
 
     # Use :past(hour/day/week/month/year) if available
     # example search "new restaurants :past month"
     lang = ''
-    if ':past' in query and 'tbs' not in args:
-        time_range = str.strip(query.split(':past', 1)[-1])
-        param_dict['tbs'] = '&tbs=' + ('qdr:' + str.lower(time_range[0]))
+    if intent.time_range and 'tbs' not in args:
+        param_dict['tbs'] = '&tbs=qdr:' + intent.time_range
     elif 'tbs' in args or 'tbs' in config:
         result_tbs = args.get('tbs') if 'tbs' in args else config['tbs']
         param_dict['tbs'] = '&tbs=' + result_tbs
@@ -114,14 +117,6 @@ def gen_query(query, args, config) -> str:
     ) if config.lang_interface else ''
     param_dict['safe'] = '&safe=' + ('active' if config.safe else 'off')
 
-    # Block all sites specified in the user config
-    unquoted_query = urlparse.unquote(query)
-    for blocked_site in config.block.replace(' ', '').split(','):
-        if not blocked_site:
-            continue
-        block = (' -site:' + blocked_site)
-        query += block if block not in unquoted_query else ''
-
     for val in param_dict.values():
         if not val:
             continue
@@ -185,8 +180,8 @@ class Request:
         # DuckDuckGo's API doesn't use the same language/country params as Google
         # It automatically detects language based on query content
 
-        response = self.send(base_url=AUTOCOMPLETE_URL,
-                             query=urlparse.urlencode(ac_query)).text
+        response = decode_body(self.send(base_url=AUTOCOMPLETE_URL,
+                                         query=urlparse.urlencode(ac_query)))
 
         if not response:
             return []
@@ -202,7 +197,7 @@ class Request:
             return []
 
     def send(self, base_url='', query='', attempt=0,
-             force_mobile=False, user_agent='') -> Response:
+             force_mobile=False, user_agent='', stream=False) -> Response:
         """Sends an outbound request to a URL. Optionally sends the request
         Args:
             base_url: The URL to use in the request
@@ -211,6 +206,8 @@ class Request:
 
             force_mobile: Optional flag to enable a mobile user agent
                 (used for fetching full size images in search results)
+            stream: Optional flag to return before the body is downloaded,
+                so that it can be read incrementally
 
         Returns:
             Response: The Response object returned by the requests call
@@ -259,11 +256,9 @@ class Request:
             search_url_to_use + query,
             proxies=self.proxies,
             headers=headers,
-            cookies=cookies)
-
-        # Handle captcha response
-        if 'form id="captcha-form"' in response.text:
-            # Return the captcha response for handling upstream
-            pass
+            cookies=cookies,
+            stream=stream)
 
+        # Captcha responses are returned as is and handled upstream (see
+        # query_engine.has_captcha)
         return response
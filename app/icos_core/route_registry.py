@@ -33,6 +33,10 @@ class IcosRouteRegistry(Enum):
     element = 'element'
     window = 'window'
 
+    # Structured data routes
+    api_search = 'api/search'
+    api_autocomplete = 'api/autocomplete'
+
     def __str__(self) -> str:
         """Return the string representation of the route value."""
         return self.value
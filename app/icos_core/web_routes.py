@@ -29,9 +29,10 @@ from app.icos_toolkit.content_processor import bold_search_terms,\
     add_currency_card, check_currency, get_tabs_content
 from app.icos_toolkit.query_engine import Search, needs_https, has_captcha
 from app.icos_toolkit.user_session import valid_user_session
+from app.icos_toolkit.body_decoder import decode_body
 from bs4 import BeautifulSoup as bsoup
 from flask import jsonify, make_response, request, redirect, render_template, \
-    send_file, session, url_for, g, current_app
+    send_file, session, stream_with_context, url_for, g, current_app, Response
 from requests import exceptions
 from requests.models import PreparedRequest
 import secrets
@@ -40,6 +41,19 @@ from werkzeug.datastructures import MultiDict
 ac_var = 'WHOOGLE_AUTOCOMPLETE'
 autocomplete_enabled = os.getenv(ac_var, '1')
 
+stream_var = 'WHOOGLE_STREAM_RESULTS'
+instant_var = 'WHOOGLE_INSTANT_ANSWERS'
+lite_budget_var = 'WHOOGLE_LITE_BUDGET'
+
+# Default byte budget for lite mode results pages
+LITE_BUDGET = 16 * 1024
+
+# Reports how many bytes a lite mode page saved over the full results page
+LITE_SAVED_HEADER = 'X-Lite-Bytes-Saved'
+
+# Marks where the results are inserted when streaming the results page
+RESULTS_PLACEHOLDER = '<!--icos-search-results-->'
+
 
 def get_search_name(tbm):
     for tab in current_app.config['HEADER_TABS'].values():
@@ -305,6 +319,76 @@ def search():
     if not query:
         return redirect(url_for('.index'))
 
+    # If the user is attempting to translate a string, determine the correct
+    # string for formatting the lingva.ml url
+    localization_lang = g.user_config.get_localization_lang()
+    translation = app.config['TRANSLATIONS'][localization_lang]
+
+    # Answer widget queries (i.e. "my ip") locally, unless the web results
+    # were requested
+    if search_util.widget and read_config_bool(instant_var) and \
+            not search_util.search_type and \
+            not search_util.feeling_lucky and \
+            request.args.get('instant') != '0':
+        answer = get_instant_answer(
+            search_util.widget,
+            encrypt_string(g.session_key, query),
+            get_client_ip(request),
+            nojs='nojs' in request.args,
+            params=search_util.get_config_params())
+        if answer:
+            return render_search_page(search_util, decrypted_display_query,
+                                      translation, answer)
+
+    if search_util.lite and not search_util.feeling_lucky:
+        return render_lite_search(search_util, decrypted_display_query,
+                                  translation)
+
+    # Lucky searches redirect once the response is ready, so they can't be
+    # streamed
+    if read_config_bool(stream_var) and not search_util.feeling_lucky:
+        page = render_search_page(search_util, decrypted_display_query,
+                                  translation, RESULTS_PLACEHOLDER)
+        page_head, page_tail = page.split(RESULTS_PLACEHOLDER, 1)
+
+        def stream_search():
+            # Send the page shell (styles, header, tabs) before the upstream
+            # request is made
+            yield page_head
+            # The response has already started, so errors are shown inline
+            # (with a 200 status), and the fallback engine is linked instead
+            # of redirected to
+            try:
+                response = search_util.generate_response()
+            except Exception as e:
+                yield render_template('error_message.html',
+                                      error_message=str(e))
+                yield page_tail
+                return
+
+            if has_captcha(response):
+                app.logger.error('503 (CAPTCHA)')
+                fallback_engine = os.environ.get(
+                    'WHOOGLE_FALLBACK_ENGINE_URL', '')
+                yield render_template(
+                    'error_message.html',
+                    blocked=True,
+                    error_message=translation['ratelimit'],
+                    fallback_url=fallback_engine + urlparse.quote(query)
+                    if fallback_engine else '',
+                    translation=translation,
+                    farside='https://farside.link',
+                    query=decrypted_display_query,
+                    params=g.user_config.to_params(keys=['vortex']))
+            else:
+                # Matches the whitespace stripping of the rendered page
+                yield format_search_response(
+                    search_util, response, query).replace("  ", "")
+            yield page_tail
+
+        return Response(stream_with_context(stream_search()),
+                        mimetype='text/html')
+
     # Generate response and number of external elements from the page
     try:
         response = search_util.generate_response()
@@ -315,37 +399,177 @@ def search():
     if search_util.feeling_lucky:
         return redirect(response, code=303)
 
-    # If the user is attempting to translate a string, determine the correct
-    # string for formatting the lingva.ml url
-    localization_lang = g.user_config.get_localization_lang()
-    translation = app.config['TRANSLATIONS'][localization_lang]
-    translate_to = localization_lang.replace('lang_', '')
-
-    # removing st-card to only use whoogle time selector
-    soup = bsoup(response, "html.parser");
-    for x in soup.find_all(attrs={"id": "st-card"}):
-        x.replace_with("")
-
-    response = str(soup)
-
     # Return 503 if temporarily blocked by captcha
-    if has_captcha(str(response)):
+    if has_captcha(response):
         app.logger.error('503 (CAPTCHA)')
         fallback_engine = os.environ.get('WHOOGLE_FALLBACK_ENGINE_URL', '')
         if (fallback_engine):
             return redirect(fallback_engine + query)
         
-        return render_template(
-            'error.html',
-            blocked=True,
-            error_message=translation['ratelimit'],
-            translation=translation,
-            farside='https://farside.link',
-            config=g.user_config,
-            query=decrypted_display_query,
-            params=g.user_config.to_params(keys=['vortex'])), 503
+        return render_captcha_error(decrypted_display_query, translation), 503
+
+    return render_search_page(
+        search_util,
+        decrypted_display_query,
+        translation,
+        format_search_response(search_util, response, query))
+
+
+def truncate_snippet(snippet: str, length: int) -> str:
+    """Shortens a snippet to a maximum length, at a word boundary if possible
+
+    Args:
+        snippet: The result snippet
+        length: The maximum length, including the trailing ellipsis
+
+    Returns:
+        str: The (possibly) shortened snippet
+    """
+    if len(snippet) <= length:
+        return snippet
+    if length <= 1:
+        return ''
+    cut = snippet[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '\u2026'
+
+
+def fit_lite_page(results: list, render, budget: int) -> str:
+    """Renders a lite mode results page within a byte budget. Snippets are
+    truncated evenly until the page fits, and if it still doesn't fit
+    without any snippets, results are dropped from the end of the page.
+
+    Args:
+        results: The Result records to render
+        render: Function rendering a page for a list of results
+        budget: The maximum page size in bytes, or 0 for no limit
+
+    Returns:
+        str: The rendered page
+    """
+    page = render(results)
+    over = len(page.encode()) - budget
+    if budget <= 0 or over <= 0:
+        return page
+
+    snippets = [result.snippet for result in results]
+    with_snippets = max(len([_ for _ in snippets if _]), 1)
+    length = max((len(_) for _ in snippets), default=0)
+    while over > 0 and length > 0:
+        length -= over // with_snippets + 1
+        for result, snippet in zip(results, snippets):
+            result.snippet = truncate_snippet(snippet, length)
+        page = render(results)
+        over = len(page.encode()) - budget
+
+    while over > 0 and results:
+        results = results[:-1]
+        page = render(results)
+        over = len(page.encode()) - budget
+    return page
+
+
+def render_lite_search(search_util: Search, query: str, translation: dict):
+    """Renders the results for a query as a lite mode page: a minimal
+    template with inlined styles, no scripts, images or favicons, and a
+    size limited to the lite byte budget
+
+    Args:
+        search_util: The Search for the query
+        query: The user's (decrypted) query
+        translation: The translation strings for the user's language
+
+    Returns:
+        Response: The lite results page
+    """
+    try:
+        results = search_util.generate_results()
+    except Exception as e:
+        session['error_message'] = str(e)
+        return redirect(url_for('.index'))
+
+    if search_util.captcha:
+        app.logger.error('503 (CAPTCHA)')
+        return render_captcha_error(query, translation), 503
+
+    next_page = ''
+    if results:
+        try:
+            start = int(request.args.get('start') or 0)
+        except ValueError:
+            start = 0
+        next_params = {'q': encrypt_string(g.session_key, query),
+                       'start': start + 10,
+                       'lite': 1}
+        if search_util.search_type:
+            next_params['tbm'] = search_util.search_type
+        next_page = 'search?' + urlparse.urlencode(next_params)
+
+    # Append user config to all search links, the same as for regular
+    # results pages
+    param_str = search_util.get_config_params()
+    if next_page:
+        next_page += param_str
+    for result in results:
+        if 'search?' in result.url and result.url.index('search?') <= 1:
+            result.url += param_str
+
+    def render(page_results: list) -> str:
+        return render_template('lite.html',
+                               query=query,
+                               search_type=search_util.search_type,
+                               translation=translation,
+                               results=page_results,
+                               next_page=next_page)
+
+    try:
+        budget = int(os.getenv(lite_budget_var, LITE_BUDGET))
+    except ValueError:
+        budget = LITE_BUDGET
+
+    page = fit_lite_page(results, render, budget)
+    response = make_response(page)
+    response.headers[LITE_SAVED_HEADER] = str(
+        max(search_util.filtered_size - len(page.encode()), 0))
+    return response
+
+
+def render_captcha_error(query: str, translation: dict) -> str:
+    return render_template(
+        'error.html',
+        blocked=True,
+        error_message=translation['ratelimit'],
+        translation=translation,
+        farside='https://farside.link',
+        config=g.user_config,
+        query=query,
+        params=g.user_config.to_params(keys=['vortex']))
 
-    response = bold_search_terms(response, query)
+
+def format_search_response(search_util: Search, response: str,
+                           query: str) -> str:
+    """Applies the final formatting to a filtered results page (time
+    selector removal, search term bolding and widgets)
+
+    Args:
+        search_util: The Search used to generate the response
+        response: The filtered results page
+        query: The user's query
+
+    Returns:
+        str: The html to insert into the results page
+    """
+    if search_util.image_results:
+        # Rendered from extracted results, so there's nothing to format
+        return response
+
+    # removing st-card to only use whoogle time selector
+    soup = bsoup(response, "html.parser")
+    for x in soup.find_all(attrs={"id": "st-card"}):
+        x.replace_with("")
+
+    response = bold_search_terms(soup, query)
 
     # check for widgets and add if requested
     if search_util.widget != '':
@@ -355,13 +579,6 @@ def search():
         elif search_util.widget == 'calculator' and not 'nojs' in request.args:
             response = add_calculator_card(html_soup)
 
-    # Update tabs content
-    tabs = get_tabs_content(app.config['HEADER_TABS'],
-                            search_util.full_query,
-                            search_util.search_type,
-                            g.user_config.vortex,
-                            translation)
-
     # Feature to display currency_card
     # Since this is determined by more than just the
     # query is it not defined as a standard widget
@@ -370,30 +587,46 @@ def search():
         html_soup = bsoup(str(response), 'html.parser')
         response = add_currency_card(html_soup, conversion)
 
+    return str(response)
+
+
+def render_search_page(search_util: Search, query: str, translation: dict,
+                       response: str) -> str:
+    """Renders the results page around the formatted results
+
+    Args:
+        search_util: The Search used for the query
+        query: The user's (decrypted) query
+        translation: The translation strings for the user's language
+        response: The formatted results html
+
+    Returns:
+        str: The rendered results page
+    """
+    # Update tabs content
+    tabs = get_tabs_content(app.config['HEADER_TABS'],
+                            search_util.get_full_query(),
+                            search_util.search_type,
+                            g.user_config.vortex,
+                            translation)
+
     vortex = g.user_config.vortex
     home_url = f"home?vortex={vortex}" if vortex else "home"
-    cleanresponse = str(response).replace("andlt;","&lt;").replace("andgt;","&gt;")
 
     return render_template(
         'display.html',
         has_update=app.config['HAS_UPDATE'],
-        query=decrypted_display_query,
+        query=query,
         search_type=search_util.search_type,
         search_name=get_search_name(search_util.search_type),
         config=g.user_config,
         autocomplete_enabled=autocomplete_enabled,
         lingva_url=app.config['TRANSLATE_URL'],
         translation=translation,
-        translate_to=translate_to,
-        translate_str=decrypted_display_query.replace(
-            'translate', ''
-        ).replace(
-            translation['translate'], ''
-        ),
-        is_translation=any(
-            _ in decrypted_display_query.lower() for _ in [translation['translate'], 'translate']
-        ) and not search_util.search_type,  # Standard search queries only
-        response=cleanresponse,
+        translate_to=search_util.intent.translate_to,
+        translate_str=search_util.intent.translate_str,
+        is_translation=search_util.intent.translate,
+        response=response,
         version_number=app.config['VERSION_NUMBER'],
         google_api_key=os.getenv('GOOGLE_API_KEY', ''),
         search_header=render_template(
@@ -402,12 +635,77 @@ def search():
             config=g.user_config,
             translation=translation,
             logo=render_template('logo.html', dark=g.user_config.dark),
-            query=decrypted_display_query,
+            query=query,
             search_type=search_util.search_type,
             mobile=g.user_request.mobile,
             tabs=tabs)).replace("  ", "")
 
 
+@session_required
+@auth_required
+def api_search():
+    """Returns the filtered results for a query as JSON, skipping the html
+    page rendering. The optional "fields" arg is a comma separated list of
+    the result attributes to include.
+
+    Image searches (tbm=isch) return the image results, and "feeling lucky"
+    queries return the url they would redirect to.
+    """
+    search_util = Search(request, g.user_config, g.session_key)
+    query = search_util.new_search_query()
+    if not query:
+        return jsonify({'error': 'Missing query'}), 400
+
+    fields = [_.strip() for _ in
+              g.request_params.get('fields', '').split(',') if _.strip()]
+
+    try:
+        body = None
+        if search_util.feeling_lucky:
+            body = search_util.fetch_body()
+            if lucky_link := search_util.find_lucky_link(body):
+                return jsonify({
+                    'query': query,
+                    'search_type': search_util.search_type,
+                    'lucky': True,
+                    'url': lucky_link
+                })
+
+        if search_util.search_type == 'isch' and body is None:
+            results = [{field: image[field]
+                        for field in fields or image if field in image}
+                       for image in search_util.generate_image_results()]
+        else:
+            results = [result.to_dict(fields) for result in
+                       search_util.generate_results(body)]
+    except Exception:
+        app.logger.exception('API search failed')
+        return jsonify({'error': 'Internal server error'}), 500
+
+    if search_util.captcha:
+        app.logger.error('503 (CAPTCHA)')
+        return jsonify({'error': 'Blocked by captcha'}), 503
+
+    return jsonify({
+        'query': query,
+        'search_type': search_util.search_type,
+        'results': results
+    })
+
+
+@auth_required
+def api_autocomplete():
+    """Returns autocomplete suggestions for a query as JSON"""
+    q = g.request_params.get('q', '')
+    if (os.getenv(ac_var) and not read_config_bool(ac_var)) or not q:
+        return jsonify({'query': q, 'suggestions': []})
+
+    return jsonify({
+        'query': q,
+        'suggestions': g.user_request.autocomplete(q)
+    })
+
+
 #@app.route(f'/{Endpoint.config}', methods=['GET', 'POST', 'PUT'])
 @session_required
 @auth_required  
@@ -565,11 +863,14 @@ def window():
 
     host_url = f'{target.scheme}://{target.netloc}'
 
-    get_body = g.user_request.send(base_url=target_url).text
+    get_body = decode_body(g.user_request.send(base_url=target_url))
 
     results = bsoup(get_body, 'html.parser')
     src_attrs = ['src', 'href', 'srcset', 'data-srcset', 'data-src']
 
+    # Apply the ad/tracker filter lists to the page
+    content_filter.apply_filter_lists(results, site=target.netloc)
+
     # Parse HTML response and replace relative links w/ absolute
     for element in results.find_all():
         for attr in src_attrs:
@@ -745,6 +1046,8 @@ def register_routes(app_instance):
     app_instance.route(f'/{Endpoint.search_html}', methods=['GET'])(search_html)
     app_instance.route(f'/{Endpoint.autocomplete}', methods=['GET', 'POST'])(autocomplete)
     app_instance.route(f'/{Endpoint.search}', methods=['GET', 'POST'])(search)
+    app_instance.route(f'/{Endpoint.api_search}', methods=['GET', 'POST'])(api_search)
+    app_instance.route(f'/{Endpoint.api_autocomplete}', methods=['GET', 'POST'])(api_autocomplete)
     app_instance.route(f'/{Endpoint.config}', methods=['GET', 'POST', 'PUT'])(config)
     app_instance.route(f'/{Endpoint.imgres}')(imgres)
     app_instance.route(f'/{Endpoint.element}')(element)
@@ -0,0 +1,121 @@
+"""
+User blocklists
+
+Compiles the sites, result titles and result urls blocked in a user's config
+into a Blocklist that results can be checked against server side, instead
+of excluding each site in the upstream query with "-site:".
+
+    - sites ("example.com") go into a hashed domain suffix set, so that any
+      subdomain of a blocked site is also blocked
+    - sites with a path ("example.com/forum") are matched by url prefix
+    - title and url patterns are compiled once
+
+Blocklists are cached by the config values they're built from, so each
+distinct config is only compiled once.
+"""
+
+from functools import lru_cache
+import logging
+import re
+from typing import Optional, Tuple
+import urllib.parse as urlparse
+
+from app.icos_toolkit.filter_lists import DomainSet
+
+# Number of distinct user configs to keep compiled blocklists for
+BLOCKLIST_CACHE_SIZE = 128
+
+
+def get_blocked_sites(block: str) -> Tuple[str, ...]:
+    """Splits the comma separated blocked sites config value
+
+    Args:
+        block: The "block" config value
+
+    Returns:
+        tuple: The blocked sites
+    """
+    return tuple(_ for _ in block.replace(' ', '').split(',') if _)
+
+
+def _compile(pattern: str) -> Optional[re.Pattern]:
+    if not pattern:
+        return None
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        logging.warning(f'Ignoring invalid block pattern "{pattern}": {e}')
+        return None
+
+
+class Blocklist:
+    """The sites, titles and urls blocked by a user's config"""
+    def __init__(self, block='', block_title='', block_url=''):
+        self.sites = DomainSet()
+        self.site_paths = []
+        for site in get_blocked_sites(block.lower()):
+            site = site.split('://', 1)[-1]
+            if '/' in site.rstrip('/'):
+                site = site[4:] if site.startswith('www.') else site
+                self.site_paths.append(site.rstrip('/'))
+            else:
+                self.sites.add(site.rstrip('/'))
+        self.site_paths = tuple(self.site_paths)
+        self.title = _compile(block_title)
+        self.url = _compile(block_url)
+
+    def __bool__(self) -> bool:
+        return bool(self.sites or self.site_paths or self.title or self.url)
+
+    def blocks_url(self, url: str, href='') -> bool:
+        """Checks if a result url is blocked
+
+        Args:
+            url: The result url
+            href: The link's original href (i.e. a "/url?q=" redirect), also
+                  checked against the blocked url pattern
+
+        Returns:
+            bool: True if the url is blocked
+        """
+        if self.url and (self.url.search(url) or
+                         (href and self.url.search(href))):
+            return True
+
+        if not url.startswith(('http://', 'https://')):
+            return False
+        parsed = urlparse.urlparse(url)
+        if parsed.netloc in self.sites:
+            return True
+
+        if self.site_paths:
+            host = parsed.netloc.lower()
+            host = host[4:] if host.startswith('www.') else host
+            return (host + parsed.path).startswith(self.site_paths)
+        return False
+
+    def blocks_title(self, title: str) -> bool:
+        """Checks if a result title is blocked
+
+        Args:
+            title: The result title
+
+        Returns:
+            bool: True if the title is blocked
+        """
+        return bool(self.title and self.title.search(title))
+
+
+@lru_cache(maxsize=BLOCKLIST_CACHE_SIZE)
+def get_blocklist(block='', block_title='', block_url='') -> Blocklist:
+    """Returns the compiled blocklist for a set of config values
+
+    Args:
+        block: The comma separated blocked sites
+        block_title: The blocked result title pattern
+        block_url: The blocked result url pattern
+
+    Returns:
+        Blocklist: The compiled blocklist
+    """
+    return Blocklist(block, block_title, block_url)
@@ -0,0 +1,144 @@
+"""
+Upstream response body decoding
+
+Decodes response bodies without falling back to requests' statistical
+charset detection (chardet), which is very slow on large pages. The
+encoding is taken from, in order:
+
+    - the charset in the Content-Type header
+    - a <meta charset> (or http-equiv Content-Type) in the first few KB
+    - UTF-8, replacing any invalid bytes
+
+The number of bodies decoded through each source is counted in
+`decode_counts`, and logged (at debug level) every DECODE_LOG_INTERVAL
+bodies.
+"""
+
+import codecs
+from collections import Counter
+import logging
+import re
+from typing import Iterator, Optional, Tuple
+
+from requests import Response
+
+# Number of bytes checked for a <meta> charset declaration
+META_SNIFF_BYTES = 4096
+
+# Size of the chunks read from streamed responses
+CHUNK_SIZE = 16 * 1024
+
+DEFAULT_ENCODING = 'utf-8'
+
+HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET = re.compile(
+    rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+# Decoded bodies by the source of their encoding ("header", "meta", or
+# "default")
+decode_counts = Counter()
+
+# Number of decoded bodies between each log of the decode counts
+DECODE_LOG_INTERVAL = 100
+
+
+def _count_decode(source: str) -> None:
+    decode_counts[source] += 1
+    if sum(decode_counts.values()) % DECODE_LOG_INTERVAL == 0:
+        logging.debug(f'Decoded bodies by encoding source: '
+                      f'{dict(decode_counts)}')
+
+
+def _valid_encoding(encoding: Optional[str]) -> Optional[str]:
+    if not encoding:
+        return None
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return None
+
+
+def header_encoding(response: Response) -> Optional[str]:
+    """Returns the charset declared in a response's Content-Type header.
+    Unlike requests, no default is assumed for text/* content types.
+
+    Args:
+        response: The upstream response
+
+    Returns:
+        str: The declared encoding, or None if missing or unknown
+    """
+    match = HEADER_CHARSET.search(response.headers.get('Content-Type', ''))
+    return _valid_encoding(match.group(1)) if match else None
+
+
+def sniff_encoding(head: bytes) -> Optional[str]:
+    """Finds a <meta> charset declaration in the start of a document
+
+    Args:
+        head: The first bytes of the document
+
+    Returns:
+        str: The declared encoding, or None if missing or unknown
+    """
+    match = META_CHARSET.search(head[:META_SNIFF_BYTES])
+    return _valid_encoding(match.group(1).decode('ascii', 'ignore')) \
+        if match else None
+
+
+def get_encoding(response: Response, head: bytes) -> Tuple[str, str]:
+    """Determines the encoding of a response body
+
+    Args:
+        response: The upstream response
+        head: The first bytes of the body
+
+    Returns:
+        tuple: The encoding, and the source it was found in
+    """
+    if encoding := header_encoding(response):
+        return encoding, 'header'
+    if encoding := sniff_encoding(head):
+        return encoding, 'meta'
+    return DEFAULT_ENCODING, 'default'
+
+
+def decode_body(response: Response) -> str:
+    """Decodes a response body. Use in place of response.text.
+
+    Args:
+        response: The upstream response
+
+    Returns:
+        str: The decoded body
+    """
+    content = response.content or b''
+    encoding, source = get_encoding(response, content)
+    _count_decode(source)
+    return content.decode(encoding, errors='replace')
+
+
+def iter_decoded(response: Response,
+                 chunk_size=CHUNK_SIZE) -> Iterator[str]:
+    """Decodes a streamed response body as it's read. The encoding is
+    determined from the first chunk, and multi-byte characters split across
+    chunks are handled by an incremental decoder.
+
+    Args:
+        response: The response, requested with stream=True
+        chunk_size: The number of bytes to read at a time
+
+    Returns:
+        Iterator[str]: The decoded chunks of the body
+    """
+    decoder = None
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if decoder is None:
+            encoding, source = get_encoding(response, chunk)
+            _count_decode(source)
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        if text := decoder.decode(chunk):
+            yield text
+
+    if decoder is not None and (text := decoder.decode(b'', final=True)):
+        yield text
@@ -0,0 +1,262 @@
+"""
+Response compression
+
+WSGI middleware that compresses text responses (results pages, json, css,
+js, etc) with brotli or gzip, based on the request's Accept-Encoding.
+
+    - buffered responses are compressed in one pass, if they're larger than
+      the minimum size for their content type
+    - streamed responses (no Content-Length) are compressed chunk by chunk,
+      flushing after each chunk so that the client still receives each part
+      of the page as soon as it's sent
+    - already encoded responses, partial content and the /element
+      pass-through (which only serves images and audio) are left as is
+"""
+
+import itertools
+import zlib
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import brotli
+
+from app.icos_core.route_registry import Endpoint
+
+# Minimum response size in bytes, brotli quality and gzip level by content
+# type. Streamed responses are always compressed, since their size isn't
+# known up front.
+COMPRESSION_RULES = {
+    'text/html': (1024, 5, 6),
+    'text/css': (1024, 6, 6),
+    'text/plain': (1024, 5, 6),
+    'text/javascript': (1024, 6, 6),
+    'application/javascript': (1024, 6, 6),
+    'application/json': (512, 5, 6),
+    'application/xml': (512, 5, 6),
+    'application/opensearchdescription+xml': (512, 5, 6),
+    'image/svg+xml': (1024, 6, 6),
+}
+
+# Encodings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+# Paths that only serve binary (already compressed) payloads
+SKIP_PATHS = (f'/{Endpoint.element}',)
+
+# Statuses that have no body, or only part of one
+SKIP_STATUSES = ('1', '204', '206', '304')
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the preferred supported encoding from an Accept-Encoding header
+
+    Args:
+        accept_encoding: The Accept-Encoding header value
+
+    Returns:
+        str: "br" or "gzip", or None if neither is accepted
+    """
+    accepted = {}
+    for value in accept_encoding.lower().split(','):
+        coding, _, params = value.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+
+    wildcard = accepted.get('*', 0.0)
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def _header(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    return next((value for key, value in headers if key.lower() == name),
+                None)
+
+
+def _vary(headers: List[Tuple[str, str]]) -> str:
+    vary = [_.strip() for _ in (_header(headers, 'Vary') or '').split(',')
+            if _.strip()]
+    if 'accept-encoding' not in (_.lower() for _ in vary):
+        vary.append('Accept-Encoding')
+    return ', '.join(vary)
+
+
+def _with_vary(headers: List[Tuple[str, str]]) -> list:
+    return [(key, value) for key, value in headers
+            if key.lower() != 'vary'] + [('Vary', _vary(headers))]
+
+
+class Compressor:
+    """Incremental brotli/gzip compressor"""
+    def __init__(self, encoding: str, quality: int, level: int):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=quality)
+            self._process = self._compressor.process
+        else:
+            self._compressor = zlib.compressobj(
+                level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._process = self._compressor.compress
+        self.encoding = encoding
+
+    def process(self, data: bytes) -> bytes:
+        return self._process(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """Compresses the responses of a WSGI app (see module docstring)
+
+    Attributes:
+        app: The wrapped WSGI app
+        rules: The compression rules by content type (see COMPRESSION_RULES)
+    """
+    def __init__(self, app: Callable, rules: dict = None):
+        self.app = app
+        self.rules = rules if rules is not None else COMPRESSION_RULES
+
+    def _compressible(
+            self, headers: List[Tuple[str, str]]) -> Optional[tuple]:
+        if _header(headers, 'Content-Encoding') or \
+                'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return None
+        content_type = (_header(headers, 'Content-Type') or '').split(';')[0]
+        return self.rules.get(content_type.strip().lower())
+
+    def _rule(self, status: str,
+              headers: List[Tuple[str, str]]) -> Optional[tuple]:
+        if status.startswith(SKIP_STATUSES):
+            return None
+        return self._compressible(headers)
+
+    def _vary_start_response(self, start_response: Callable) -> Callable:
+        # Responses that could have been compressed vary by Accept-Encoding
+        # even when they aren't, so that shared caches don't serve an
+        # uncompressed copy to every client
+        def vary_start_response(status, headers, exc_info=None):
+            if self._compressible(headers):
+                headers = _with_vary(headers)
+            return start_response(status, headers, exc_info)
+        return vary_start_response
+
+    @staticmethod
+    def _encoded_headers(headers: List[Tuple[str, str]], encoding: str,
+                         length: Optional[int] = None) -> list:
+        encoded = [(key, value) for key, value in _with_vary(headers)
+                   if key.lower() != 'content-length']
+        encoded.append(('Content-Encoding', encoding))
+        if length is not None:
+            encoded.append(('Content-Length', str(length)))
+
+        # The compressed body is a different representation, so strong
+        # validators no longer apply
+        return [(key, 'W/' + value)
+                if key.lower() == 'etag' and not value.startswith('W/')
+                else (key, value) for key, value in encoded]
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable:
+        if environ.get('PATH_INFO', '').startswith(SKIP_PATHS):
+            return self.app(environ, start_response)
+
+        vary_start_response = self._vary_start_response(start_response)
+        encoding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, vary_start_response)
+
+        response = {}
+        in_app_call = True
+
+        def compress_start_response(status, headers, exc_info=None):
+            response['started'] = True
+            rule = self._rule(status, headers)
+            if rule is None:
+                return vary_start_response(status, headers, exc_info)
+
+            length = _header(headers, 'Content-Length')
+            if in_app_call and length is not None:
+                # Buffered response, compressed once the body is available
+                if int(length) < rule[0]:
+                    # Not worth compressing, but larger responses for the
+                    # same url may be
+                    return start_response(status, _with_vary(headers),
+                                          exc_info)
+                response.update(status=status, headers=headers,
+                                exc_info=exc_info, rule=rule)
+                return lambda data: response.setdefault(
+                    'written', []).append(data)
+
+            response.update(rule=rule, stream=True)
+            return start_response(
+                status, self._encoded_headers(headers, encoding), exc_info)
+
+        app_iter = self.app(environ, compress_start_response)
+        in_app_call = False
+        if not response.get('started'):
+            # The response is only started once it's iterated
+            return _lazy_stream(app_iter, response, encoding)
+        if 'rule' not in response:
+            return app_iter
+
+        _, quality, level = response['rule']
+        compressor = Compressor(encoding, quality, level)
+        if response.get('stream'):
+            return _stream(app_iter, compressor)
+
+        try:
+            body = b''.join(response.get('written', []) + list(app_iter))
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        compressed = compressor.process(body) + compressor.finish()
+        start_response(response['status'],
+                       self._encoded_headers(response['headers'], encoding,
+                                             len(compressed)),
+                       response['exc_info'])
+        return [compressed]
+
+
+def _stream(app_iter: Iterable, compressor: Compressor) -> Iterable[bytes]:
+    try:
+        for chunk in app_iter:
+            if not chunk:
+                continue
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def _lazy_stream(app_iter: Iterable, response: dict,
+                 encoding: str) -> Iterable[bytes]:
+    chunks = iter(app_iter)
+    try:
+        first = next(chunks, b'')
+        if 'rule' not in response:
+            yield first
+            yield from chunks
+            return
+
+        _, quality, level = response['rule']
+        compressor = Compressor(encoding, quality, level)
+        yield from _stream(itertools.chain([first], chunks), compressor)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
@@ -1,5 +1,6 @@
 from app.icos_core.user_preferences import Config
 from app.icos_core.route_registry import Endpoint
+from app.icos_toolkit.filter_lists import SubstringMatcher
 from app.icos_toolkit.platform_helpers import list_to_dict
 from bs4 import BeautifulSoup, NavigableString
 import copy
@@ -9,11 +10,14 @@ import os
 import urllib.parse as urlparse
 from urllib.parse import parse_qs
 import re
+from typing import Optional
 import warnings
 
 SKIP_ARGS = ['ref_src', 'utm']
 SKIP_PREFIX = ['//www.', '//mobile.', '//m.']
 GOOG_STATIC = 'www.gstatic.com'
+# Disclaimer link included in Google's currency conversion cards
+CURRENCY_DISCLAIMER = 'https://g.co/gfd'
 G_M_LOGO_URL = 'https://www.gstatic.com/m/images/icons/googleg.gif'
 GOOG_IMG = '/images/branding/searchlogo/1x/googlelogo'
 LOGO_URL = GOOG_IMG + '_desk'
@@ -30,6 +34,7 @@ BLACKLIST = [
     'Anúncio', 'Quảng cáo', 'โฆษณา', 'sponsored', 'patrocinado', 'gesponsert',
     'Sponzorováno', '스폰서', 'Gesponsord', 'Sponsorisé'
 ]
+BLACKLIST_LABELS = frozenset(value.upper() for value in BLACKLIST)
 
 SITE_ALTS = {
     'twitter.com': os.getenv('WHOOGLE_ALT_TW', 'farside.link/nitter'),
@@ -49,6 +54,11 @@ SITE_ALTS = {
 # Include custom site redirects from WHOOGLE_REDIRECTS
 SITE_ALTS.update(list_to_dict(re.split(',|:', os.getenv('WHOOGLE_REDIRECTS', ''))))
 
+# Enabled site alternatives indexed by hostname, and a matcher for finding
+# any of the sites in result descriptions
+SITE_ALT_INDEX = {site: alt for site, alt in SITE_ALTS.items() if alt}
+SITE_ALT_MATCHER = SubstringMatcher(SITE_ALTS.keys())
+
 
 def contains_cjko(s: str) -> bool:
     """This function check whether or not a string contains Chinese, Japanese,
@@ -71,101 +81,137 @@ def contains_cjko(s: str) -> bool:
     return bool(re.search(fr'[{unicode_ranges}]', s))
 
 
-def bold_search_terms(response: str, query: str) -> BeautifulSoup:
+def bold_search_terms(response, query: str) -> BeautifulSoup:
     """Wraps all search terms in bold tags (<b>). If any terms are wrapped
     in quotes, only that exact phrase will be made bold.
 
     Args:
-        response: The initial response body for the query
+        response: The initial response body for the query, either as a
+                  string or an already parsed soup
         query: The original search query
 
     Returns:
         BeautifulSoup: modified soup object with bold items
     """
-    response = BeautifulSoup(response, 'html.parser')
+    if not isinstance(response, BeautifulSoup):
+        response = BeautifulSoup(response, 'html.parser')
 
-    def replace_any_case(element: NavigableString, target_word: str) -> None:
-        # Replace all instances of the word, but maintaining the same case in
-        # the replacement
-        if len(element) == len(target_word):
-            return
+    terms_pattern = compile_search_terms(query)
+    if not terms_pattern:
+        return response
 
-        # Ensure target word is escaped for regex
-        target_word = re.escape(target_word)
+    for element in response.find_all(string=terms_pattern):
+        # Skip comments/doctypes and style contents
+        if type(element) is not NavigableString or (
+                element.parent and element.parent.name == 'style'):
+            continue
 
-        # Check if the word contains Chinese, Japanese, or Korean characters
-        if contains_cjko(target_word):
-            reg_pattern = fr'((?![{{}}<>-]){target_word}(?![{{}}<>-]))'
-        else:
-            reg_pattern = fr'\b((?![{{}}<>-]){target_word}(?![{{}}<>-]))\b'
+        text = str(element)
+        matches = list(terms_pattern.finditer(text))
 
-        if re.match(r'.*[@_!#$%^&*()<>?/\|}{~:].*', target_word) or (
-                element.parent and element.parent.name == 'style'):
-            return
+        # Don't bold strings that consist only of the search term
+        if not matches or matches[0].end() - matches[0].start() == len(text):
+            continue
+
+        # Split the string into plain text and <b> nodes, maintaining the
+        # same case as the original text
+        nodes = []
+        last = 0
+        for match in matches:
+            if match.start() > last:
+                nodes.append(NavigableString(text[last:match.start()]))
+            bold = response.new_tag('b')
+            bold.string = match.group(0)
+            nodes.append(bold)
+            last = match.end()
+        if last < len(text):
+            nodes.append(NavigableString(text[last:]))
+
+        element.replace_with(*nodes)
+
+    return response
+
+
+def compile_search_terms(query: str) -> Optional[re.Pattern]:
+    """Compiles all words and quoted phrases of a query into a single
+    case-insensitive pattern, with longer terms matched first.
+
+    Args:
+        query: The original search query
 
-        element.replace_with(BeautifulSoup(
-            re.sub(reg_pattern,
-                   r'<b>\1</b>',
-                   element,
-                   flags=re.I), 'html.parser')
-        )
+    Returns:
+        re.Pattern: The compiled pattern, or None if the query has no terms
+    """
+    terms = set()
 
     # Split all words out of query, grouping the ones wrapped in quotes
     for word in re.split(r'\s+(?=[^"]*(?:"[^"]*"[^"]*)*$)', query):
-        word = re.sub(r'[@_!#$%^&*()<>?/\|}{~:]+', '', word)
-        target = response.find_all(
-            text=re.compile(r'' + re.escape(word), re.I))
-        for nav_str in target:
-            replace_any_case(nav_str, word)
+        word = re.sub(r'[@_!#$%^&*()<>?/\|}{~:]+', '', word).strip('"')
+        if word.strip():
+            terms.add(word)
 
-    return response
+    if not terms:
+        return None
+
+    alternatives = []
+    for term in sorted(terms, key=len, reverse=True):
+        target_word = re.escape(term)
+
+        # Check if the word contains Chinese, Japanese, or Korean characters,
+        # which aren't separated by word boundaries
+        if contains_cjko(term):
+            alternatives.append(fr'(?![{{}}<>-]){target_word}(?![{{}}<>-])')
+        else:
+            alternatives.append(
+                fr'\b(?![{{}}<>-]){target_word}(?![{{}}<>-])\b')
+
+    return re.compile('|'.join(alternatives), re.I)
 
 
-def has_ad_content(element: str) -> bool:
+def has_ad_content(element: str, labels: frozenset = BLACKLIST_LABELS) -> bool:
     """Inspects an HTML element for ad related content
 
     Args:
         element: The HTML element to inspect
+        labels: The upper case ad labels to check against. Defaults to the
+                built-in BLACKLIST
 
     Returns:
         bool: True/False for the element containing an ad
 
     """
     element_str = ''.join(filter(str.isalpha, element))
-    return (element_str.upper() in (value.upper() for value in BLACKLIST)
-            or 'ⓘ' in element)
+    return element_str.upper() in labels or 'ⓘ' in element
 
 
-def get_first_link(soup: BeautifulSoup) -> str:
-    """Retrieves the first result link from the query response
+def get_lucky_link(results: BeautifulSoup) -> str:
+    """Retrieves the first organic result link from a results page that has
+    had its ads and blocked results removed (see Filter.find_lucky_link).
+    Links inside <details> (i.e. "People also ask") and links to Google are
+    skipped, and Google's "/url?q=" redirects are unwrapped.
 
     Args:
-        soup: The BeautifulSoup response body
+        results: The results div (or full page) to search
 
     Returns:
-        str: A str link to the first result
+        str: A str link to the first result, or an empty string
 
     """
-    first_link = ''
-    orig_details = []
-
-    # Temporarily remove details so we don't grab those links
-    for details in soup.find_all('details'):
-        temp_details = soup.new_tag('removed_details')
-        orig_details.append(details.replace_with(temp_details))
-
-    # Replace hrefs with only the intended destination (no "utm" type tags)
-    for a in soup.find_all('a', href=True):
-        # Return the first search result URL
-        if a['href'].startswith('http://') or a['href'].startswith('https://'):
-            first_link = a['href']
-            break
+    for a in results.find_all('a', href=True):
+        if a.find_parent('details'):
+            continue
 
-    # Add the details back
-    for orig_detail, details in zip(orig_details, soup.find_all('removed_details')):
-        details.replace_with(orig_detail)
+        link = a['href']
+        if link.startswith('/url?'):
+            link = parse_qs(urlparse.urlparse(link).query).get('q', [''])[0]
+
+        netloc = urlparse.urlparse(link).netloc
+        if not link.startswith(('http://', 'https://')) or \
+                netloc == 'google' or '.google.' in f'.{netloc}':
+            continue
+        return filter_link_args(link)
 
-    return first_link
+    return ''
 
 
 def get_site_alt(link: str, site_alts: dict = SITE_ALTS) -> str:
@@ -187,18 +233,21 @@ def get_site_alt(link: str, site_alts: dict = SITE_ALTS) -> str:
     # is used for wikiless translations.
     split_host = parsed_link.netloc.split('.')
     subdomain = split_host[0] if len(split_host) > 2 else ''
-    hostname = '.'.join(split_host[-2:])
 
-    # The full scheme + hostname is used when comparing against the list of
-    # available alternative services, due to how Medium links are constructed.
-    # (i.e. for medium.com: "https://something.medium.com" should match,
-    # "https://medium.com/..." should match, but "philomedium.com" should not)
-    hostcomp = f'{parsed_link.scheme}://{hostname}'
+    # Look up the hostname by its suffixes, longest first, down to the
+    # domain+tld. Whole labels are compared, so for medium.com
+    # "https://something.medium.com" and "https://medium.com/..." match, but
+    # "philomedium.com" does not.
+    site_index = SITE_ALT_INDEX if site_alts is SITE_ALTS else {
+        site: alt for site, alt in site_alts.items() if alt}
+    hostname = ''
+    for idx in range(max(len(split_host) - 2, 0) + 1):
+        if (candidate := '.'.join(split_host[idx:])) in site_index:
+            hostname = candidate
+            break
 
-    for site_key in site_alts.keys():
-        site_alt = f'{parsed_link.scheme}://{site_key}'
-        if not hostname or site_alt not in hostcomp or not site_alts[site_key]:
-            continue
+    if hostname:
+        site_key = hostname
 
         # Wikipedia -> Wikiless replacements require the subdomain (if it's
         # a 2-char language code) to be passed as a URL param to Wikiless
@@ -227,7 +276,6 @@ def get_site_alt(link: str, site_alts: dict = SITE_ALTS) -> str:
             else:
                 # Otherwise, replace the first occurrence of the prefix
                 link = link.replace(prefix, '//', 1)
-        break
 
     return link
 
@@ -314,8 +362,12 @@ def check_currency(response: str) -> dict:
         dict: Consists of currency names and values
 
     """
+    # Most pages don't have a conversion card, so skip parsing those
+    if CURRENCY_DISCLAIMER not in response:
+        return {}
+
     soup = BeautifulSoup(response, 'html.parser')
-    currency_link = soup.find('a', {'href': 'https://g.co/gfd'})
+    currency_link = soup.find('a', {'href': CURRENCY_DISCLAIMER})
     if currency_link:
         while 'class' not in currency_link.attrs or \
                 'ZINbbc' not in currency_link.attrs['class']:
@@ -369,7 +421,7 @@ def add_currency_card(soup: BeautifulSoup,
     """
     # Element before which the code will be changed
     # (This is the 'disclaimer' link)
-    element1 = soup.find('a', {'href': 'https://g.co/gfd'})
+    element1 = soup.find('a', {'href': CURRENCY_DISCLAIMER})
 
     while 'class' not in element1.attrs or \
             'nXE3Ob' not in element1.attrs['class']:
@@ -0,0 +1,467 @@
+"""
+Ad and tracker filter lists
+
+Loads EasyList-style filter lists from the config volume and compiles them
+once at startup into structures that can be queried in constant time per
+element while filtering result pages:
+
+    - network rules ("||ads.example.com^") go into a hashed domain suffix set
+    - plain substring rules ("-ad-300x250.") go into an Aho-Corasick automaton
+    - cosmetic rules ("##.ad-box", "###sponsored") go into per-id, per-class
+      and per-tag selector indexes
+
+Rules that can't be represented by these structures (regex rules, complex
+CSS selectors, wildcard patterns, etc) are skipped and counted.
+"""
+
+from collections import deque
+import glob
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set
+import urllib.parse as urlparse
+
+FILTER_LIST_EXT = '.txt'
+AD_LABEL_EXT = '.labels'
+
+# Simple selectors supported by the cosmetic index, i.e. "div", ".cls",
+# "#id", "div.cls" or "div#id"
+SIMPLE_SELECTOR = re.compile(
+    r'^(?P<tag>[a-zA-Z][a-zA-Z0-9-]*)?'
+    r'(?:(?P<kind>[.#])(?P<name>-?[_a-zA-Z][_a-zA-Z0-9-]*))?$')
+
+# Characters that can't appear in a plain substring network rule
+COMPLEX_RULE_CHARS = set('*^|')
+
+# Network rule options that only narrow a rule down by resource type or
+# party, so the rule can be applied regardless of them. Any other option
+# (i.e. "$csp=", "$redirect=", "$domain=", "$elemhide") changes what the
+# rule does, so rules using one are skipped.
+PLAIN_RULE_OPTIONS = {
+    'script', 'image', 'stylesheet', 'object', 'xmlhttprequest',
+    'subdocument', 'ping', 'media', 'font', 'other', 'websocket',
+    'third-party', 'first-party', '3p', '1p', 'match-case'
+}
+
+
+class SubstringMatcher:
+    """Aho-Corasick automaton for matching a large set of substrings in a
+    single pass over the input, regardless of how many patterns are loaded.
+
+    Attributes:
+        patterns: the number of patterns compiled into the automaton
+    """
+    def __init__(self, patterns: Iterable[str] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[str]] = [None]
+        self.patterns = 0
+
+        for pattern in patterns:
+            self.add(pattern)
+        self.compile()
+
+    def __bool__(self) -> bool:
+        return self.patterns > 0
+
+    def add(self, pattern: str) -> None:
+        """Adds a pattern to the trie. The automaton must be recompiled
+        afterwards for the pattern to be matched.
+
+        Args:
+            pattern: The substring to match
+
+        Returns:
+            None
+        """
+        if not pattern:
+            return
+
+        node = 0
+        for char in pattern.lower():
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+            node = next_node
+
+        if self._out[node] is None:
+            self._out[node] = pattern
+            self.patterns += 1
+
+    def compile(self) -> None:
+        """Builds the failure links of the automaton (breadth first)
+
+        Returns:
+            None
+        """
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._out[child] is None:
+                    # Propagate matches ending at the failure state so that
+                    # a single lookup per state is enough while searching
+                    self._out[child] = self._out[self._fail[child]]
+
+    def search(self, text: str) -> Optional[str]:
+        """Finds the first pattern contained in a string
+
+        Args:
+            text: The string to scan
+
+        Returns:
+            str: The first matching pattern, or None if nothing matched
+        """
+        if not self.patterns or not text:
+            return None
+
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
+    def findall(self, text: str) -> Set[str]:
+        """Finds all of the patterns contained in a string
+
+        Args:
+            text: The string to scan
+
+        Returns:
+            set: The matching patterns
+        """
+        matches = set()
+        if not self.patterns or not text:
+            return matches
+
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            # Follow the failure links for patterns that are suffixes of
+            # the longest match ending here
+            match = node
+            while match and out[match] is not None:
+                matches.add(out[match])
+                match = fail[match]
+        return matches
+
+    def __contains__(self, text: str) -> bool:
+        return self.search(text) is not None
+
+
+class DomainSet:
+    """Hashed set of domains that also matches any subdomain of an entry,
+    i.e. "ads.example.com" matches an entry of "example.com"
+    """
+    def __init__(self, domains: Iterable[str] = ()):
+        self._domains: Set[str] = set()
+        for domain in domains:
+            self.add(domain)
+
+    def __bool__(self) -> bool:
+        return bool(self._domains)
+
+    def __len__(self) -> int:
+        return len(self._domains)
+
+    def add(self, domain: str) -> None:
+        domain = domain.strip().strip('.').lower()
+        if domain:
+            self._domains.add(domain)
+
+    def match(self, host: str) -> Optional[str]:
+        """Finds the entry matching a hostname or one of its parents
+
+        Args:
+            host: The hostname to check (ports are ignored)
+
+        Returns:
+            str: The matching entry, or None if the host isn't in the set
+        """
+        if not self._domains or not host:
+            return None
+
+        host = host.split(':', 1)[0].lower()
+        while host:
+            if host in self._domains:
+                return host
+            dot = host.find('.')
+            if dot < 0:
+                break
+            host = host[dot + 1:]
+        return None
+
+    def __contains__(self, host: str) -> bool:
+        return self.match(host) is not None
+
+
+class CosmeticIndex:
+    """Index of element hiding selectors, keyed by id, class and tag so that
+    each element can be checked with a handful of set lookups.
+    """
+    def __init__(self):
+        self.ids: Set[str] = set()
+        self.classes: Set[str] = set()
+        self.tags: Set[str] = set()
+        self.tag_classes: Set[tuple] = set()
+        self.tag_ids: Set[tuple] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.ids or self.classes or self.tags or
+                    self.tag_classes or self.tag_ids)
+
+    def add(self, selector: str) -> bool:
+        """Adds a simple selector to the index
+
+        Args:
+            selector: The CSS selector from the cosmetic rule
+
+        Returns:
+            bool: True if the selector could be indexed, otherwise False
+        """
+        match = SIMPLE_SELECTOR.match(selector.strip())
+        if not match or not (match['tag'] or match['name']):
+            return False
+
+        tag = match['tag'].lower() if match['tag'] else ''
+        if not match['name']:
+            self.tags.add(tag)
+        elif match['kind'] == '#':
+            if tag:
+                self.tag_ids.add((tag, match['name']))
+            else:
+                self.ids.add(match['name'])
+        else:
+            if tag:
+                self.tag_classes.add((tag, match['name']))
+            else:
+                self.classes.add(match['name'])
+        return True
+
+    def matches(self, tag_name: str, attrs: dict) -> bool:
+        """Checks an element against the index
+
+        Args:
+            tag_name: The element's tag name
+            attrs: The element's attributes
+
+        Returns:
+            bool: True if the element should be hidden
+        """
+        if tag_name in self.tags:
+            return True
+
+        elem_id = attrs.get('id')
+        if elem_id and (elem_id in self.ids or
+                        (tag_name, elem_id) in self.tag_ids):
+            return True
+
+        classes = attrs.get('class')
+        if not classes:
+            return False
+        if isinstance(classes, str):
+            classes = classes.split()
+        for cls in classes:
+            if cls in self.classes or (tag_name, cls) in self.tag_classes:
+                return True
+        return False
+
+
+class FilterLists:
+    """Compiled set of ad/tracker filter rules
+
+    Attributes:
+        blocked_domains: domains blocked by "||domain^" network rules
+        allowed_domains: domains excluded from blocking by "@@" rules
+        blocked_substrings: automaton of plain substring network rules
+        cosmetic: generic element hiding selectors
+        site_cosmetic: element hiding selectors scoped to specific domains
+        ad_labels: upper case labels used by Google to mark ads
+        skipped: number of rules that couldn't be compiled
+    """
+    def __init__(self, ad_labels: Iterable[str] = ()):
+        self.blocked_domains = DomainSet()
+        self.allowed_domains = DomainSet()
+        self.blocked_substrings = SubstringMatcher()
+        self.cosmetic = CosmeticIndex()
+        self.site_cosmetic: Dict[str, CosmeticIndex] = {}
+        self.ad_labels = frozenset(label.upper() for label in ad_labels)
+        self.skipped = 0
+        self.rules = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.blocked_domains or self.blocked_substrings or
+                    self.cosmetic or self.site_cosmetic)
+
+    def add_rule(self, rule: str) -> None:
+        """Parses a single EasyList-style rule into the matching structure.
+        The automaton must be recompiled after adding substring rules.
+
+        Args:
+            rule: The filter rule
+
+        Returns:
+            None
+        """
+        rule = rule.strip()
+        if not rule or rule.startswith('!') or rule.startswith('['):
+            return
+
+        if '#@#' in rule or '#?#' in rule or '#$#' in rule:
+            # Element hiding exceptions and extended syntax aren't supported
+            self.skipped += 1
+            return
+
+        if '##' in rule:
+            domains, selector = rule.split('##', 1)
+            if not domains:
+                indexed = self.cosmetic.add(selector)
+            else:
+                indexed = False
+                for domain in domains.split(','):
+                    if not domain or domain.startswith('~'):
+                        continue
+                    index = self.site_cosmetic.setdefault(
+                        domain.lower(), CosmeticIndex())
+                    indexed = index.add(selector) or indexed
+            self.rules += indexed
+            self.skipped += not indexed
+            return
+
+        exception = rule.startswith('@@')
+        if exception:
+            rule = rule[2:]
+
+        # Type and party options (i.e. "$third-party,script") only narrow
+        # the rule down, so the rule is applied regardless of them
+        rule, _, options = rule.partition('$')
+        if options and any(
+                option.strip().lstrip('~').lower() not in PLAIN_RULE_OPTIONS
+                for option in options.split(',')):
+            self.skipped += 1
+            return
+
+        if rule.startswith('/') and rule.endswith('/') and len(rule) > 1:
+            # Regex rules
+            self.skipped += 1
+            return
+
+        if rule.startswith('||'):
+            domain = rule[2:].rstrip('^|/')
+            if not domain or any(c in domain for c in '*/^|'):
+                self.skipped += 1
+                return
+            (self.allowed_domains if exception
+             else self.blocked_domains).add(domain)
+            self.rules += 1
+            return
+
+        pattern = rule.strip('*|')
+        if exception or len(pattern) < 4 or \
+                any(c in COMPLEX_RULE_CHARS for c in pattern):
+            self.skipped += 1
+            return
+
+        self.blocked_substrings.add(pattern)
+        self.rules += 1
+
+    def add_list(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.add_rule(line)
+        self.blocked_substrings.compile()
+
+    def blocks_url(self, url: str) -> bool:
+        """Checks a URL against the network rules
+
+        Args:
+            url: The absolute (or protocol relative) URL to check
+
+        Returns:
+            bool: True if the URL should be blocked
+        """
+        if not url or not self:
+            return False
+
+        host = urlparse.urlparse(
+            'https:' + url if url.startswith('//') else url).netloc
+        if host and host in self.allowed_domains:
+            return False
+        if host and host in self.blocked_domains:
+            return True
+        return url in self.blocked_substrings
+
+    def hides(self, tag_name: str, attrs: dict, site: str = '') -> bool:
+        """Checks an element against the cosmetic rules
+
+        Args:
+            tag_name: The element's tag name
+            attrs: The element's attributes
+            site: The hostname of the page, for site specific rules
+
+        Returns:
+            bool: True if the element should be removed
+        """
+        if self.cosmetic.matches(tag_name, attrs):
+            return True
+
+        if site and self.site_cosmetic:
+            while site:
+                index = self.site_cosmetic.get(site)
+                if index and index.matches(tag_name, attrs):
+                    return True
+                site = site.partition('.')[2]
+        return False
+
+
+def load_filter_lists(path: str, ad_labels: Iterable[str] = ()) -> FilterLists:
+    """Loads and compiles every filter list in a directory. Files ending in
+    ".txt" are parsed as EasyList-style lists, and files ending in ".labels"
+    add one ad label per line to the built-in list.
+
+    Args:
+        path: The directory containing the filter lists
+        ad_labels: The built-in ad labels
+
+    Returns:
+        FilterLists: The compiled filter lists
+    """
+    labels = list(ad_labels)
+    filter_lists = FilterLists()
+
+    for list_file in sorted(glob.glob(os.path.join(path, '*'))):
+        try:
+            with open(list_file, encoding='utf-8', errors='replace') as f:
+                if list_file.endswith(AD_LABEL_EXT):
+                    labels.extend(_.strip() for _ in f if _.strip())
+                elif list_file.endswith(FILTER_LIST_EXT):
+                    filter_lists.add_list(f)
+        except OSError as e:
+            logging.warning(f'Unable to load filter list {list_file}: {e}')
+
+    filter_lists.ad_labels = frozenset(_.upper() for _ in labels)
+    if filter_lists.skipped:
+        logging.info(f'Filter lists: compiled {filter_lists.rules} rules, '
+                     f'skipped {filter_lists.skipped} unsupported rules')
+    return filter_lists
@@ -0,0 +1,104 @@
+"""
+Image result extraction
+
+Pulls the image results (thumbnail, full size image, source page and its
+domain) out of upstream image search pages, so that the images tab can be
+rendered from a list of results rather than by cleaning and merging
+Google's markup. Only the links of each page are parsed.
+
+Each result records its position among the upstream page's results, so
+that pagination can follow the upstream offsets even when some results
+are dropped (duplicates and pages hosted by Google).
+"""
+
+from typing import List, Optional, Tuple
+import urllib.parse as urlparse
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+
+from app.icos_core.route_registry import Endpoint
+
+# Only links are built when parsing image pages
+IMAGE_LINKS = SoupStrainer('a', href=True)
+
+
+def _is_google(netloc: str) -> bool:
+    return netloc == 'google' or '.google.' in f'.{netloc}'
+
+
+def parse_image_link(link: Tag) -> Optional[dict]:
+    """Parses an image result from a result link
+
+    Args:
+        link: A link containing the result thumbnail
+
+    Returns:
+        dict: The result's domain, img_url (the full size image, if linked),
+              web_page and img_tbn (the thumbnail), or None if the link isn't
+              an image result (including direct links to Google pages, i.e.
+              the logo or navigation)
+    """
+    img = link.find('img')
+    if img is None:
+        return None
+    img_tbn = img.get('src') or img.get('data-src') or ''
+    if not img_tbn:
+        return None
+
+    href = link['href']
+    img_url = ''
+    redirect = True
+    if f'{Endpoint.imgres}?' in href:
+        query = urlparse.parse_qs(urlparse.urlparse(href).query)
+        img_url = query.get('imgurl', [''])[0]
+        web_page = query.get('imgrefurl', [''])[0]
+    elif '/url?' in href:
+        query = urlparse.parse_qs(urlparse.urlparse(href).query)
+        web_page = (query.get('q') or query.get('url') or [''])[0]
+    else:
+        web_page = href
+        redirect = False
+
+    domain = urlparse.urlparse(web_page).netloc
+    if not web_page.startswith(('http://', 'https://')) or (
+            not redirect and _is_google(domain)):
+        return None
+
+    return {
+        'domain': domain,
+        'img_url': img_url,
+        'web_page': web_page,
+        'img_tbn': img_tbn
+    }
+
+
+def extract_images(html: str) -> Tuple[List[dict], int]:
+    """Extracts the image results from an upstream image search page.
+    Results with a thumbnail already on the page, or from pages hosted by
+    Google, are left out.
+
+    Args:
+        html: The image search page
+
+    Returns:
+        tuple: The image results (see parse_image_link) in page order, each
+               with its "position" among the page's upstream results, and
+               the number of upstream results on the page
+    """
+    links = BeautifulSoup(html, 'html.parser', parse_only=IMAGE_LINKS)
+    results = []
+    seen = set()
+    count = 0
+    for link in links.find_all('a'):
+        result = parse_image_link(link)
+        if result is None:
+            continue
+        result['position'] = count
+        count += 1
+
+        if result['img_tbn'] in seen or _is_google(result['domain']):
+            continue
+        seen.add(result['img_tbn'])
+        results.append(result)
+    return results, count
@@ -1,18 +1,35 @@
 import os
 import re
-from typing import Any
-from app.icos_core.content_filter import Filter
+from typing import Any, List, Optional, Tuple, Union
+from app.icos_core.content_filter import Filter, Result
 from app.icos_core.network_handler import gen_query
-from app.icos_toolkit.platform_helpers import get_proxy_host_url
-from app.icos_toolkit.content_processor import get_first_link
+from app.icos_toolkit.platform_helpers import decrypt_string, \
+    encrypt_string, get_proxy_host_url, read_config_bool
+from app.icos_toolkit.content_processor import filter_link_args, \
+    get_site_alt
+from app.icos_toolkit.blocklist import get_blocklist
+from app.icos_toolkit.body_decoder import decode_body, iter_decoded
+from app.icos_toolkit.image_results import extract_images
+from app.icos_toolkit.query_intent import QueryIntent, classify_query
+from app.icos_toolkit.soup_builder import parse_result_regions, parse_stream
 from bs4 import BeautifulSoup as bsoup
 import secrets
+import urllib.parse as urlparse
 from app.icos_toolkit.security_shield import SecureURLShield
 from flask import g
 
 
 CAPTCHA = 'div class="g-recaptcha"'
 
+lite_var = 'WHOOGLE_LITE'
+
+# Image results are shown IMAGES_PER_RESULTS_PAGE at a time, fetched from
+# upstream pages of IMAGES_PER_PAGE
+IMAGES_PER_RESULTS_PAGE = 100
+IMAGES_PER_PAGE = 20
+IMAGE_PAGES = IMAGES_PER_RESULTS_PAGE // IMAGES_PER_PAGE
+IMAGE_START = re.compile(r'&start=\d*')
+
 
 def needs_https(url: str) -> bool:
     """Checks if the current instance needs to be upgraded to HTTPS
@@ -66,10 +83,24 @@ class Search:
         self.session_key = session_key
         self.query = ''
         self.widget = ''
+        self.intent = QueryIntent()
+        self.captcha = False
+        self.full_query = ''
         self.cookies_disabled = cookies_disabled
         self.search_type = self.request_params.get(
             'tbm') if 'tbm' in self.request_params else ''
 
+        # Lite mode can be toggled per request with the "lite" arg, and
+        # doesn't apply to image results
+        lite = self.request_params.get('lite')
+        self.lite = self.search_type != 'isch' and (
+            lite == '1' if lite is not None else read_config_bool(lite_var))
+        self.filtered_size = 0
+
+        # Set once image results have been rendered from their template,
+        # which needs no further formatting
+        self.image_results = False
+
     def __getitem__(self, name) -> Any:
         return getattr(self, name)
 
@@ -105,30 +136,46 @@ class Search:
             except Exception:
                 pass
 
-        # Strip '!' for "feeling lucky" queries
-        if match := re.search("(^|\s)!($|\s)", q):
-            self.feeling_lucky = True
-            start, end = match.span()
-            self.query = " ".join([seg for seg in [q[:start], q[end:]] if seg])
-        else:
-            self.feeling_lucky = False
-            self.query = q
-
-        # Check for possible widgets
-        self.widget = "ip" if re.search("([^a-z0-9]|^)my *[^a-z0-9] *(ip|internet protocol)" +
-                        "($|( *[^a-z0-9] *(((addres|address|adres|" +
-                        "adress)|a)? *$)))", self.query.lower()) else self.widget
-        self.widget = 'calculator' if re.search(
-                r"\bcalculator\b|\bcalc\b|\bcalclator\b|\bmath\b",
-                self.query.lower()) else self.widget
+        # Determine what the query is for (lucky, widgets, time range, etc)
+        # once, for use when generating and formatting the results
+        self.intent = classify_query(q, self.config, self.search_type)
+        self.feeling_lucky = self.intent.lucky
+        self.query = self.intent.query
+        self.widget = self.intent.widget
         return self.query
 
-    def generate_response(self) -> str:
-        """Generates a response for the user's query
+    def get_full_query(self) -> str:
+        """Returns the full query string sent to Google for the user's query,
+        generating it on first use
 
         Returns:
-            str: A string response to the search query, in the form of a URL
-                 or string representation of HTML content.
+            str: The full query string
+
+        """
+        if not self.full_query:
+            self.full_query = gen_query(self.query,
+                                        self.request_params,
+                                        self.config,
+                                        intent=self.intent)
+        return self.full_query
+
+    def fetch_body(self) -> str:
+        """Fetches the results page for the user's query, without parsing it
+
+        Returns:
+            str: The decoded results page
+
+        """
+        get_body = g.user_request.send(query=self.get_full_query(),
+                                       force_mobile=self.config.view_image,
+                                       user_agent=self.user_agent)
+        return decode_body(get_body)
+
+    def _get_filter(self) -> Filter:
+        """Creates the content filter for the user's query
+
+        Returns:
+            Filter: The content filter
 
         """
         mobile = 'Android' in self.user_agent or 'iPhone' in self.user_agent
@@ -138,15 +185,30 @@ class Search:
             self.request.url_root,
             root=True)
 
-        content_filter = Filter(self.session_key,
-                                root_url=root_url,
-                                mobile=mobile,
-                                config=self.config,
-                                query=self.query)
-        full_query = gen_query(self.query,
-                               self.request_params,
-                               self.config)
-        self.full_query = full_query
+        return Filter(self.session_key,
+                      root_url=root_url,
+                      mobile=mobile,
+                      config=self.config,
+                      query=self.query,
+                      search_type=self.search_type,
+                      lite=self.lite)
+
+    def _clean_results(
+            self,
+            body: Optional[str] = None) -> Tuple[Filter, Union[bsoup, str]]:
+        """Fetches the results page for the user's query and runs it through
+        the content filter
+
+        Args:
+            body: The already fetched results page, if available
+
+        Returns:
+            tuple: The content filter used and the cleaned results page (or
+                   the rendered html, for image results)
+
+        """
+        content_filter = self._get_filter()
+        full_query = self.get_full_query()
 
         # force mobile search when view image is true and
         # the request is not already made by a mobile
@@ -155,39 +217,141 @@ class Search:
                       # and self.config.view_image
                       # and not g.user_request.mobile)
 
-        # For image searches, fetch multiple pages to get 100 images
-        if 'tbm=isch' in full_query and 'start=' not in full_query:
-            combined_html = self._fetch_multiple_image_pages(full_query)
-            html_soup = bsoup(combined_html, 'html.parser')
-        else:
+        if body is None and 'tbm=isch' in full_query:
+            # For image searches, fetch multiple pages to get 100 images,
+            # continuing from where the previous page left off
+            start, skip = self._image_cursor()
+            images, first_page, cursor = self._fetch_image_results(
+                IMAGE_START.sub('', full_query), start, skip)
+            if images and not self.captcha:
+                next_page = self._image_next_page(cursor) if cursor else ''
+                self.image_results = True
+                return content_filter, content_filter.render_images(
+                    images, next_page)
+            html_soup = bsoup(first_page, 'html.parser')
+        elif body is None and read_config_bool('WHOOGLE_STREAM_UPSTREAM'):
             get_body = g.user_request.send(query=full_query,
                                            force_mobile=self.config.view_image,
-                                           user_agent=self.user_agent)
+                                           user_agent=self.user_agent,
+                                           stream=True)
+
+            # Parse the response as it's downloaded
+            captcha_tail = ''
+
+            def check_captcha(chunk: str) -> None:
+                nonlocal captcha_tail
+                self.captcha = self.captcha or has_captcha(
+                    captcha_tail + chunk)
+                captcha_tail = chunk[-len(CAPTCHA):]
 
+            html_soup = parse_stream(iter_decoded(get_body),
+                                     on_chunk=check_captcha)
+        else:
             # Produce cleanable html soup from response
-            get_body_safed = get_body.text.replace("&lt;","andlt;").replace("&gt;","andgt;")
-            html_soup = bsoup(get_body_safed, 'html.parser')
+            if body is None:
+                body = self.fetch_body()
+            self.captcha = has_captcha(body)
+
+            # Only build the regions of the page that are kept (All tab only,
+            # falling back to a full parse if the page has no results div)
+            html_soup = None
+            if not self.search_type and read_config_bool(
+                    'WHOOGLE_TARGETED_PARSE'):
+                html_soup = parse_result_regions(body)
+            if html_soup is None:
+                html_soup = bsoup(body, 'html.parser')
 
         # Replace current soup if view_image is active
         # FIXME: Broken since the user agent changes as of 16 Jan 2025
         # if view_image:
             # html_soup = content_filter.view_image(html_soup)
 
+        return content_filter, content_filter.clean(html_soup)
+
+    def find_lucky_link(self, body: str) -> str:
+        """Finds the link to redirect "feeling lucky" searches to, removing
+        ads and blocked results from the upstream page without running the
+        rest of the content filter
+
+        Args:
+            body: The fetched results page
+
+        Returns:
+            str: The first result link (with the site alt applied, if alts
+                 are enabled), or an empty string if none was found
+
+        """
+        # Only the results need to be parsed, falling back to the full page
+        # if it has no results div
+        html_soup = parse_result_regions(body) or bsoup(body, 'html.parser')
+        lucky_link = self._get_filter().find_lucky_link(html_soup)
+        if lucky_link and self.config.alts:
+            return get_site_alt(lucky_link)
+        return lucky_link
+
+    def generate_results(self, body: Optional[str] = None) -> List[Result]:
+        """Generates structured results for the user's query, without
+        serializing the results page
+
+        Args:
+            body: The already fetched results page, if available
 
+        Returns:
+            list: The Result records extracted from the results page
+
+        """
+        content_filter, formatted_results = self._clean_results(body)
+        if self.lite:
+            # Size of the filtered page, for reporting the bytes saved by
+            # rendering the results in lite mode
+            self.filtered_size = len(str(formatted_results).encode())
+        return content_filter.extract_results()
+
+    def generate_image_results(self) -> List[dict]:
+        """Generates the image results for the user's query, without
+        rendering them
+
+        Returns:
+            list: The image results (see image_results.extract_images),
+                  without results from blocked sites
+
+        """
+        start, skip = self._image_cursor()
+        images, _, _ = self._fetch_image_results(
+            IMAGE_START.sub('', self.get_full_query()), start, skip)
+        blocklist = get_blocklist(self.config.block,
+                                  self.config.block_title,
+                                  self.config.block_url)
+        return [{**{key: value for key, value in image.items()
+                    if key != 'position'},
+                 'web_page': filter_link_args(image['web_page'])}
+                for image in images
+                if not (blocklist and blocklist.blocks_url(image['web_page']))]
 
-        formatted_results = content_filter.clean(html_soup)
+    def generate_response(self) -> str:
+        """Generates a response for the user's query
+
+        Returns:
+            str: A string response to the search query, in the form of a URL
+                 or string representation of HTML content.
+
+        """
+        body = None
         if self.feeling_lucky:
-            if lucky_link := get_first_link(formatted_results):
+            body = self.fetch_body()
+            if lucky_link := self.find_lucky_link(body):
                 return lucky_link
 
             # Fall through to regular search if unable to find link
             self.feeling_lucky = False
 
+        content_filter, formatted_results = self._clean_results(body)
+        if self.image_results:
+            # Already rendered, with the config params in the next page link
+            return formatted_results
+
         # Append user config to all search links, if available
-        param_str = ''.join('&{}={}'.format(k, v)
-                            for k, v in
-                            self.request_params.to_dict(flat=True).items()
-                            if self.config.is_safe_key(k))
+        param_str = self.get_config_params()
         for link in formatted_results.find_all('a', href=True):
             link['rel'] = "nofollow noopener noreferrer"
             if 'search?' not in link['href'] or link['href'].index(
@@ -197,61 +361,125 @@ class Search:
 
         return str(formatted_results)
 
-    def _fetch_multiple_image_pages(self, base_query):
-        """Fetch multiple pages of image results and combine them"""
-        all_image_results = []
-        
-        # Fetch 5 pages (20 images each = 100 total)
-        for page in range(5):
-            start_index = page * 20
-            page_query = base_query + f"&start={start_index}"
-            
+    def get_config_params(self) -> str:
+        """Returns the user config params of the request, for appending to
+        search links so that the config carries over to other pages
+
+        Returns:
+            str: The params, as "&key=value" pairs
+
+        """
+        return ''.join('&{}={}'.format(k, v)
+                       for k, v in
+                       self.request_params.to_dict(flat=True).items()
+                       if self.config.is_safe_key(k))
+
+    def _image_cursor(self) -> Tuple[int, int]:
+        """Reads the position to continue image results from. This is the
+        encrypted "cursor" arg of a next page link, or the "start" arg for
+        pages linked to directly.
+
+        Returns:
+            tuple: The upstream result offset to fetch from, and the number
+                   of results at that offset that were already shown
+        """
+        cursor = self.request_params.get('cursor')
+        try:
+            if cursor:
+                start, skip = decrypt_string(self.session_key,
+                                             cursor).split(':')
+                return max(int(start), 0), max(int(skip), 0)
+            return max(int(self.request_params.get('start') or 0), 0), 0
+        except Exception:
+            return 0, 0
+
+    def _image_next_page(self, cursor: Tuple[int, int]) -> str:
+        """Builds the link to the next page of image results
+
+        Args:
+            cursor: The upstream offset and skip count to continue from
+
+        Returns:
+            str: The next page link
+        """
+        page_start = int(self.request_params.get('start') or 0)
+        return 'search?' + urlparse.urlencode({
+            'q': encrypt_string(self.session_key, self.query),
+            'tbm': self.search_type,
+            'start': page_start + IMAGES_PER_RESULTS_PAGE,
+            'cursor': encrypt_string(self.session_key, '%d:%d' % cursor)
+        }) + self.get_config_params()
+
+    def _fetch_image_results(
+            self,
+            base_query: str,
+            start=0,
+            skip=0) -> Tuple[List[dict], str, Optional[Tuple[int, int]]]:
+        """Fetches upstream pages of image results until a full page of
+        IMAGES_PER_RESULTS_PAGE results has been extracted
+
+        Args:
+            base_query: The full query string, without a start offset
+            start: The upstream result offset to fetch from
+            skip: The position on the upstream page at that offset to
+                  continue from, the results before it having already been
+                  shown on the previous page
+
+        Returns:
+            tuple: The image results, the first fetched page (for falling
+                   back to regular filtering if no results could be
+                   extracted), and the cursor to continue from on the next
+                   page (None if there are no more results)
+        """
+        images = []
+        seen = set()
+        first_page = ''
+        cursor = None
+        for page in range(IMAGE_PAGES + 1):
             try:
-                page_response = g.user_request.send(query=page_query,
-                                                   force_mobile=self.config.view_image,
-                                                   user_agent=self.user_agent)
-                
-                # Clean the response
-                page_body_safed = page_response.text.replace("&lt;","andlt;").replace("&gt;","andgt;")
-                page_soup = bsoup(page_body_safed, 'html.parser')
-                
-                # Extract image results from this page
-                image_containers = page_soup.find_all('div', class_='isv-r')
-                all_image_results.extend(image_containers)
-                
-                # If we got fewer than 20 results, we've reached the end
-                if len(image_containers) < 20:
-                    break
-                    
-            except Exception as e:
-                # If a page fails, continue with what we have
+                page_response = g.user_request.send(
+                    query=base_query + f'&start={start}',
+                    force_mobile=self.config.view_image,
+                    user_agent=self.user_agent)
+            except Exception:
+                # If a later page fails, continue with what we have
+                if not page:
+                    raise
+                break
+
+            body = decode_body(page_response)
+            first_page = first_page or body
+            self.captcha = self.captcha or has_captcha(body)
+
+            # Offsets follow the upstream result count, which includes
+            # results that weren't extracted (duplicates, Google pages)
+            page_images, page_count = extract_images(body)
+            new_images = [_ for _ in page_images
+                          if _['position'] >= skip
+                          and _['img_tbn'] not in seen]
+            seen.update(_['img_tbn'] for _ in new_images)
+
+            room = IMAGES_PER_RESULTS_PAGE - len(images)
+            if len(new_images) > room:
+                # Continue from the rest of this upstream page
+                images.extend(new_images[:room])
+                cursor = (start, new_images[room]['position'])
+                break
+            images.extend(new_images)
+
+            # If upstream returned fewer than a full page of results, we've
+            # reached the end
+            if page_count < IMAGES_PER_PAGE:
+                break
+
+            start += page_count
+            skip = 0
+            if len(images) == IMAGES_PER_RESULTS_PAGE:
+                cursor = (start, 0)
                 break
-        
-        # Create a new soup with all combined results
-        if all_image_results:
-            # Get the base structure from the first page
-            first_page_response = g.user_request.send(query=base_query,
-                                                     force_mobile=self.config.view_image,
-                                                     user_agent=self.user_agent)
-            first_page_body = first_page_response.text.replace("&lt;","andlt;").replace("&gt;","andgt;")
-            combined_soup = bsoup(first_page_body, 'html.parser')
-            
-            # Find the main image results container
-            main_container = combined_soup.find('div', {'id': 'islmp'})
-            if main_container:
-                # Clear existing results
-                for existing in main_container.find_all('div', class_='isv-r'):
-                    existing.decompose()
-                
-                # Add all collected results
-                for result in all_image_results:
-                    main_container.append(result)
-            
-            return str(combined_soup)
         else:
-            # Fallback to single page if something went wrong
-            response = g.user_request.send(query=base_query,
-                                          force_mobile=self.config.view_image,
-                                          user_agent=self.user_agent)
-            return response.text.replace("&lt;","andlt;").replace("&gt;","andgt;")
+            # Out of upstream pages to fetch for this page, but there are
+            # more results
+            cursor = (start, 0)
 
+        return images, first_page, cursor
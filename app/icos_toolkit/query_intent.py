@@ -0,0 +1,123 @@
+"""
+Query intent classification
+
+Parses a user's query once, before it's submitted, into a QueryIntent
+describing what the query asks for beyond a regular search:
+
+    - "feeling lucky" queries ("!"), which redirect to the first result
+    - widgets shown above the results (IP address, calculator)
+    - translation requests ("translate ..."), handled by the Lingva widget
+    - time ranges (":past week"), sent to Google as a "tbs" filter
+
+All of the patterns used are compiled on import.
+"""
+
+import re
+
+from flask import current_app, has_app_context
+
+# Default translation keyword, checked in addition to the localized one
+TRANSLATE_KEYWORD = 'translate'
+
+LUCKY_PATTERN = re.compile(r'(^|\s)!($|\s)')
+IP_PATTERN = re.compile(
+    r'([^a-z0-9]|^)my *[^a-z0-9] *(ip|internet protocol)'
+    r'($|( *[^a-z0-9] *(((addres|address|adres|adress)|a)? *$)))')
+CALCULATOR_PATTERN = re.compile(
+    r'\bcalculator\b|\bcalc\b|\bcalclator\b|\bmath\b')
+TIME_RANGE_PATTERN = re.compile(r':past\s*(\w)')
+
+
+class QueryIntent:
+    """The parsed intent of a user's query
+
+    Attributes:
+        query: The query to search for, without the "feeling lucky" marker
+        lucky: Whether to redirect to the first result
+        widget: The widget to add to the results ("ip", "calculator"), or an
+                empty string
+        translate: Whether the query is a translation request
+        translate_str: The text to translate, for translation requests
+        translate_to: The language to translate to (i.e. "en")
+        time_range: The first letter of a ":past" time range (i.e. "w" for
+                    ":past week"), or an empty string
+    """
+    __slots__ = ('query', 'lucky', 'widget', 'translate', 'translate_str',
+                 'translate_to', 'time_range')
+
+    def __init__(self, query='', lucky=False, widget='', translate=False,
+                 translate_str='', translate_to='',
+                 time_range='') -> None:
+        self.query = query
+        self.lucky = lucky
+        self.widget = widget
+        self.translate = translate
+        self.translate_str = translate_str
+        self.translate_to = translate_to
+        self.time_range = time_range
+
+    def __repr__(self) -> str:
+        return (f'QueryIntent(query={self.query!r}, lucky={self.lucky}, '
+                f'widget={self.widget!r}, translate={self.translate}, '
+                f'time_range={self.time_range!r})')
+
+
+def get_translate_keyword(lang: str) -> str:
+    """Returns the localized translation keyword for an interface language,
+    if translations have been loaded by the app
+
+    Args:
+        lang: The localization language (i.e. "lang_en")
+
+    Returns:
+        str: The translation keyword
+    """
+    if not has_app_context():
+        return TRANSLATE_KEYWORD
+    translation = current_app.config['TRANSLATIONS'].get(lang, {})
+    return translation.get('translate', TRANSLATE_KEYWORD)
+
+
+def classify_query(q: str, config, search_type='') -> QueryIntent:
+    """Determines the intent of a user's query
+
+    Args:
+        q: The user's (decrypted) query
+        config: The user's config
+        search_type: The search type ("tbm" value), empty for the All tab
+
+    Returns:
+        QueryIntent: The parsed intent
+    """
+    intent = QueryIntent()
+
+    # Strip '!' for "feeling lucky" queries
+    if match := LUCKY_PATTERN.search(q):
+        intent.lucky = True
+        start, end = match.span()
+        intent.query = ' '.join([seg for seg in [q[:start], q[end:]] if seg])
+    else:
+        intent.query = q
+
+    # Check for possible widgets
+    query_lower = intent.query.lower()
+    if CALCULATOR_PATTERN.search(query_lower):
+        intent.widget = 'calculator'
+    elif IP_PATTERN.search(query_lower):
+        intent.widget = 'ip'
+
+    # Translation requests are only handled for standard searches
+    lang = config.get_localization_lang()
+    keyword = get_translate_keyword(lang)
+    intent.translate = not search_type and (
+        TRANSLATE_KEYWORD in query_lower or keyword.lower() in query_lower)
+    intent.translate_str = intent.query.replace(
+        TRANSLATE_KEYWORD, '').replace(keyword, '')
+    intent.translate_to = lang.replace('lang_', '')
+
+    # Use :past(hour/day/week/month/year) if available
+    # example search "new restaurants :past month"
+    if match := TIME_RANGE_PATTERN.search(intent.query):
+        intent.time_range = match.group(1).lower()
+
+    return intent
@@ -0,0 +1,126 @@
+"""
+Soup building for upstream responses
+
+Result pages can be parsed in a targeted mode that only builds the regions
+used by the content filter, and streamed bodies can be fed to the
+html.parser tree builder chunk by chunk, so that parsing overlaps with the
+rest of the download instead of starting once the whole body has been read.
+See body_decoder.iter_decoded for reading the chunks.
+"""
+
+from typing import Callable, Iterable, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Incremental parsing relies on the internals of bs4's html.parser tree
+# builder, so fall back to a regular parse if they aren't available
+try:
+    from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+except ImportError:
+    BeautifulSoupHTMLParser = None
+
+# Class of Google's pagination footer
+PAGINATION_CLASS = 'TuS8Ad'
+
+
+def parse_stream(
+        chunks: Iterable[str],
+        on_chunk: Optional[Callable[[str], None]] = None) -> BeautifulSoup:
+    """Builds a soup from streamed html, feeding each chunk to the parser as
+    soon as it's available. The resulting tree is the same as parsing the
+    full document with BeautifulSoup(html, 'html.parser').
+
+    If the tree builder internals this relies on aren't available (or have
+    changed), the chunks are read in full and parsed at once instead.
+
+    Args:
+        chunks: The html text chunks
+        on_chunk: Optional callback run on each chunk before it's parsed
+
+    Returns:
+        BeautifulSoup: The parsed document
+    """
+    received = []
+    chunks = iter(chunks)
+    try:
+        if BeautifulSoupHTMLParser is None:
+            raise AttributeError('BeautifulSoupHTMLParser')
+        soup = BeautifulSoup('', 'html.parser')
+        args, kwargs = soup.builder.parser_args
+        parser = BeautifulSoupHTMLParser(*args, **kwargs)
+        parser.soup = soup
+
+        for chunk in chunks:
+            received.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            parser.feed(chunk)
+        parser.close()
+        parser.already_closed_empty_element = []
+
+        # Close out any unfinished strings and open tags, the same as the end
+        # of a regular (non-incremental) parse
+        soup.endData()
+        while soup.currentTag.name != soup.ROOT_TAG_NAME:
+            soup.popTag()
+        return soup
+    except (AttributeError, TypeError):
+        for chunk in chunks:
+            received.append(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+        return BeautifulSoup(''.join(received), 'html.parser')
+
+
+def _is_result_region(name: str, attrs: dict) -> bool:
+    if name in ('style', 'footer') or attrs.get('id') == 'main':
+        return True
+    return PAGINATION_CLASS in (attrs.get('class') or '').split()
+
+
+# Top level regions of a results page that the content filter uses: the
+# results (#main), the footers and the inline styles
+RESULT_REGIONS = SoupStrainer(_is_result_region)
+
+
+class ScriptlessSoup(BeautifulSoup):
+    """BeautifulSoup that drops <script> elements (and their contents) while
+    tokenizing, rather than building them into the tree to be removed later.
+    """
+    def __init__(self, *args, **kwargs):
+        self._in_script = False
+        super().__init__(*args, **kwargs)
+
+    def handle_starttag(self, name, *args, **kwargs):
+        if name == 'script':
+            self._in_script = True
+            return None
+        return super().handle_starttag(name, *args, **kwargs)
+
+    def handle_endtag(self, name, nsprefix=None):
+        if name == 'script':
+            self._in_script = False
+            return
+        super().handle_endtag(name, nsprefix)
+
+    def handle_data(self, data):
+        if not self._in_script:
+            super().handle_data(data)
+
+
+def parse_result_regions(html: str) -> Optional[BeautifulSoup]:
+    """Parses only the regions of a results page used by the content filter
+    (see RESULT_REGIONS). Scripts, the <head> and any other top level
+    markup are skipped without being built into the tree.
+
+    Args:
+        html: The results page
+
+    Returns:
+        BeautifulSoup: The parsed regions, or None if the page has no #main
+                       results div (in which case it should be fully parsed)
+    """
+    soup = ScriptlessSoup(html, 'html.parser', parse_only=RESULT_REGIONS)
+    if not soup.find('div', {'id': 'main'}):
+        return None
+    return soup
@@ -1,9 +1,49 @@
+import copy
+from functools import lru_cache
+import logging
 from pathlib import Path
+from typing import List, Optional, Tuple
+import urllib.parse as urlparse
 from bs4 import BeautifulSoup
+from bs4.element import PageElement
 
 
 # root
 BASE_DIR = Path(__file__).parent.parent.parent
+WIDGETS_DIR = BASE_DIR / 'app/static/widgets'
+
+# Widgets that can be answered without an upstream search
+INSTANT_WIDGETS = ('ip', 'calculator')
+
+
+@lru_cache(maxsize=None)
+def _load_widget(name: str) -> Optional[Tuple[PageElement, ...]]:
+    widget_path = WIDGETS_DIR / f'{name}.html'
+    try:
+        with open(widget_path, encoding='utf8') as widget_file:
+            return tuple(BeautifulSoup(widget_file, 'html.parser').contents)
+    except OSError as e:
+        logging.warning(f'Unable to load widget {widget_path}: {e}')
+        return None
+
+
+def get_widget(name: str) -> Optional[List[PageElement]]:
+    """Returns a widget fragment from static/widgets. Each fragment is read
+    and parsed once, and its top level elements are copied for each use
+    (copying elements doesn't re-parse them, unlike copying a whole soup).
+
+    Args:
+        name: The widget name (the fragment's file name, without extension)
+
+    Returns:
+        list: The fragment's top level elements, or None if it can't be
+              loaded
+    """
+    widget = _load_widget(name)
+    if widget is None:
+        return None
+    return [copy.copy(element) for element in widget]
+
 
 def add_ip_card(html_soup: BeautifulSoup, ip: str) -> BeautifulSoup:
     """Adds the client's IP address to the search results
@@ -52,9 +92,8 @@ def add_calculator_card(html_soup: BeautifulSoup) -> BeautifulSoup:
         BeautifulSoup
     """
     main_div = html_soup.select_one('#main')
-    if main_div:
-        # absolute path
-        widget_file = open(BASE_DIR / 'app/static/widgets/calculator.html', encoding="utf8")
+    calculator = get_widget('calculator')
+    if main_div and calculator is not None:
         widget_tag = html_soup.new_tag('div')
         widget_tag['class'] = 'ZINbbc xpd O9g5cc uUPGi'
         widget_tag['id'] = 'calculator-wrapper'
@@ -62,10 +101,46 @@ def add_calculator_card(html_soup: BeautifulSoup) -> BeautifulSoup:
         calculator_text['class'] = 'kCrYT ip-address-div'
         calculator_text.string = 'Calculator'
         calculator_widget = html_soup.new_tag('div')
-        calculator_widget.append(BeautifulSoup(widget_file, 'html.parser'))
+        calculator_widget.extend(calculator)
         calculator_widget['class'] = 'kCrYT ip-text-div'
         widget_tag.append(calculator_text)
         widget_tag.append(calculator_widget)
         main_div.insert_before(widget_tag)
-        widget_file.close()
     return html_soup
+
+
+def get_instant_answer(widget: str, query: str, ip: str,
+                       nojs=False, params='') -> Optional[str]:
+    """Answers a widget query locally, without an upstream search. The
+    answer is a results div with the widget card, and a link for fetching
+    the web results for the query.
+
+    Args:
+        widget: The query's widget type (see QueryIntent.widget)
+        query: The user's query, as used in search links (encrypted)
+        ip: ip address of the client
+        nojs: Whether javascript is disabled for the results
+        params: The user's config params, appended to the web results link
+                (see Search.get_config_params)
+
+    Returns:
+        str: The answer html, or None if the widget can't be answered
+             locally
+    """
+    if widget not in INSTANT_WIDGETS or (widget == 'calculator' and (
+            nojs or _load_widget('calculator') is None)):
+        return None
+
+    html_soup = BeautifulSoup('<div id="main"></div>', 'html.parser')
+    results_link = html_soup.new_tag('a')
+    results_link['href'] = 'search?' + urlparse.urlencode(
+        {'q': query, 'instant': 0}) + params
+    results_link.string = 'Show web results'
+    results_div = html_soup.new_tag('div')
+    results_div['class'] = 'ZINbbc xpd O9g5cc uUPGi'
+    results_div.append(results_link)
+    html_soup.select_one('#main').append(results_div)
+
+    if widget == 'ip':
+        return str(add_ip_card(html_soup, ip))
+    return str(add_calculator_card(html_soup))
@@ -0,0 +1 @@
+/root/package/app/static/js/autocomplete.js
\ No newline at end of file
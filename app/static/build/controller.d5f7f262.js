@@ -0,0 +1 @@
+/root/package/app/static/js/controller.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/currency.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/favicons.js
\ No newline at end of file
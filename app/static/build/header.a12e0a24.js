@@ -0,0 +1 @@
+/root/package/app/static/js/header.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/images-fullscreen.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/keyboard.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/pagination.js
\ No newline at end of file
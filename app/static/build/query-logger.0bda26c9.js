@@ -0,0 +1 @@
+/root/package/app/static/js/query-logger.js
\ No newline at end of file
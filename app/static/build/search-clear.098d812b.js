@@ -0,0 +1 @@
+/root/package/app/static/js/search-clear.js
\ No newline at end of file
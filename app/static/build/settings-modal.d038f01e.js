@@ -0,0 +1 @@
+/root/package/app/static/js/settings-modal.js
\ No newline at end of file
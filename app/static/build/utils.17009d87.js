@@ -0,0 +1 @@
+/root/package/app/static/js/utils.js
\ No newline at end of file
@@ -0,0 +1 @@
+/root/package/app/static/js/voice-search.js
\ No newline at end of file
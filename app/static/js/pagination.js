@@ -179,12 +179,17 @@ function createPageElement(pageNum, currentPage, links, resultsPerPage = 10) {
 function createNextElement(nextLink, currentPage, resultsPerPage) {
     const link = document.createElement('a');
     
-    // Calculate next page URL properly
-    const nextPageStart = currentPage * resultsPerPage;
-    const currentUrl = new URL(window.location);
-    currentUrl.searchParams.set('start', nextPageStart);
-    
-    link.href = currentUrl.toString();
+    if (nextLink.href.includes('cursor=')) {
+        // Image results link to the next page with a cursor, so that the
+        // server continues from the results it already fetched
+        link.href = nextLink.href;
+    } else {
+        // Calculate next page URL properly
+        const nextPageStart = currentPage * resultsPerPage;
+        const currentUrl = new URL(window.location);
+        currentUrl.searchParams.set('start', nextPageStart);
+        link.href = currentUrl.toString();
+    }
     link.textContent = '>';
     link.className = 'next-link';
     link.style.cssText = `